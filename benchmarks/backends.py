@@ -0,0 +1,99 @@
+"""
+Compares the NumPy and TensorFlow backends on band math, per tile size.
+
+Runs NDVI and EVI kernels on random tiles of growing size with every
+available backend (TensorFlow both eager and compiled by XLA), and prints
+the time per tile and the tile size from which TensorFlow beats NumPy (the
+crossover point) on this machine.
+
+    $ python benchmarks/backends.py [repeat]
+"""
+import importlib.util
+import sys
+import timeit
+
+import numpy as np
+
+import ge
+import ge.backend
+from ge.image import Band
+from ge.kernel import Kernel
+
+TILE_SIZES = [32, 64, 128, 256, 512, 1024, 2048, 4096]
+
+
+def build_image(size):
+    image = ge.Image()
+    for name in ['BLUE', 'RED', 'NIR']:
+        data = np.random.randint(0, 10000, (size, size)).astype(np.uint16)
+        band = Band(name=name, type=None, data=data) \
+            .setCols(size) \
+            .setRows(size)
+        image._bands = image._bands.add(band)
+    return image
+
+
+def expressions(image):
+    nir = image.select('NIR')
+    red = image.select('RED')
+    blue = image.select('BLUE')
+    ndvi = image.normalizedDifference(['NIR', 'RED'])
+    evi = nir.subtract(red).multiply(2.5).divide(
+        nir.add(red.multiply(6)).subtract(blue.multiply(7.5)).add(1))
+    return {'ndvi': ndvi, 'evi': evi}
+
+
+def benchmark(repeat):
+    backends = ['numpy']
+    if importlib.util.find_spec('tensorflow') is not None:
+        backends += ['tensorflow', 'tensorflow-xla']
+
+    results = {}
+    for size in TILE_SIZES:
+        image = build_image(size)
+        for name, expression in expressions(image).items():
+            kernel = Kernel(list(expression.getBands()))
+            for backend in backends:
+                if backend == 'tensorflow-xla':
+                    ge.backend.use('tensorflow', jit=True)
+                else:
+                    ge.backend.use(backend)
+                current = ge.backend.current()
+
+                def run():
+                    for data in kernel():
+                        current.numpy(data)
+
+                run()  # warm up
+                seconds = min(timeit.repeat(run, number=1, repeat=repeat))
+                results[(name, size, backend)] = seconds
+    return backends, results
+
+
+def report(backends, results):
+    print("{:<6}{:>8}".format("expr", "tile") +
+          "".join("{:>16}".format(backend) for backend in backends))
+    for name in ['ndvi', 'evi']:
+        # Per backend, the smallest tile size from which it is always
+        # faster than numpy.
+        crossovers = dict((backend, None) for backend in backends[1:])
+        for size in TILE_SIZES:
+            times = [results[(name, size, backend)] for backend in backends]
+            print("{:<6}{:>8}".format(name, size) +
+                  "".join("{:>14.3f}ms".format(t * 1000) for t in times))
+            for backend, seconds in zip(backends[1:], times[1:]):
+                if seconds < times[0]:
+                    crossovers[backend] = crossovers[backend] or size
+                else:
+                    crossovers[backend] = None
+        for backend, crossover in crossovers.items():
+            print("{name} {backend} crossover: {crossover}".format(
+                name=name,
+                backend=backend,
+                crossover="{0}x{0}".format(crossover) if crossover
+                else "none, numpy is faster at every size"))
+
+
+if __name__ == '__main__':
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    report(*benchmark(repeat))
@@ -143,7 +143,7 @@ class ApiFunction(ge.function.Function):
     @classmethod
     def initialize(cls):
         """Initializes the list of signatures from the Earth Engine front-end."""
-        if not cls._api:
+        if cls._api is None:
             # signatures = data.getAlgorithms()
             api = {}
             # for name, sig in signatures.items():
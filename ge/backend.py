@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+"""Array libraries used to evaluate band expressions.
+
+Band operations are recorded by name ('add', 'divide', ...) and run by the
+backend of the process when a kernel is evaluated. Two backends ship with
+the library:
+  numpy: Plain NumPy, the default. It has no dispatch overhead and works
+      on the arrays read by GDAL in place.
+  tensorflow: TensorFlow eager ops, worth it on a GPU or for large tiles.
+      With use('tensorflow', jit=True) whole kernels are compiled by XLA.
+
+The backend is chosen once per process, with use() or with the GE_BACKEND
+environment variable. Otherwise TensorFlow is only used if the process has
+already imported it and it sees a GPU: importing it just to look for one
+would slow down every process. See benchmarks/backends.py for the tile size at which
+TensorFlow starts to pay off on a given machine.
+"""
+
+import os
+import sys
+
+import numpy as np
+
+import ge.cache
+import ge.ee_exception
+
+
+class Backend(object):
+    """The interface of a compute backend."""
+
+    name = None
+
+    # The numpy compatible array module of the backend, used by reducers.
+    xp = None
+
+    def asarray(self, data):
+        """Converts numpy data read from a band to a backend array."""
+        raise NotImplementedError()
+
+    def numpy(self, data):
+        """Converts a backend array to a numpy array."""
+        raise NotImplementedError()
+
+    def apply(self, operation, arrays, dtypes, dtype):
+        """Applies a named band operation to backend arrays.
+
+        Args:
+          operation: The name of the operation, e.g. 'add'.
+          arrays: The operands, as backend arrays.
+          dtypes: The numpy dtype each operand is converted to first, see
+              ge.dtypes.promote().
+          dtype: The numpy dtype of the result.
+
+        Returns:
+          The result, as a backend array.
+        """
+        raise NotImplementedError()
+
+    def cast(self, array, dtype):
+        """Converts a backend array to a numpy dtype."""
+        raise NotImplementedError()
+
+    def stack(self, arrays, dtype, shape=None):
+        """Stacks arrays along a new first axis, converted to a dtype.
+
+        Constants (0-d arrays) are broadcast to the shape of the bands, or
+        to shape if it is given.
+        """
+        if self.xp is None:
+            raise ge.ee_exception.EEException(
+                'Reducers are not supported by the {backend} backend.'.format(
+                    backend=self.name))
+        arrays = [self.cast(array, dtype) for array in arrays]
+        if shape is None:
+            return self.xp.stack(self.xp.broadcast_arrays(*arrays))
+        return self.xp.stack([self.xp.broadcast_to(array, shape)
+                              for array in arrays])
+
+    def run(self, program, load):
+        """Runs a kernel program, one operation at a time.
+
+        Args:
+          program: The ge.kernel.Program to run.
+          load: A function returning the (data, mask) arrays of a leaf from
+              its index, see ge.kernel.Program.execute().
+
+        Returns:
+          The list of (data, mask) arrays of the outputs.
+        """
+        return program.execute(self, load)
+
+    def _lookup(self, operations, operation):
+        func = operations.get(operation)
+        if func is None:
+            raise ge.ee_exception.EEException(
+                'Unknown operation {operation} for the {backend} backend.'
+                .format(operation=operation, backend=self.name))
+        return func
+
+
+class NumpyBackend(Backend):
+    """Runs band operations with NumPy."""
+
+    name = 'numpy'
+
+    xp = np
+
+    _operations = {
+        'add': np.add,
+        'subtract': np.subtract,
+        'multiply': np.multiply,
+        'divide': np.divide,
+        'eq': np.equal,
+        'neq': np.not_equal,
+        'gt': np.greater,
+        'gte': np.greater_equal,
+        'lt': np.less,
+        'lte': np.less_equal,
+        'max': np.maximum,
+        'min': np.minimum,
+        'matrixMultiply': np.matmul,
+        'exp': np.exp,
+        'log': np.log,
+        'pow': np.power,
+        'mod': np.fmod,
+        'abs': np.abs,
+        'sqrt': np.sqrt,
+        'floor': np.floor,
+        'ceil': np.ceil,
+        'and': np.logical_and,
+        'or': np.logical_or,
+        'not': np.logical_not,
+        'bitwiseAnd': np.bitwise_and,
+        'bitwiseOr': np.bitwise_or,
+        'bitwiseXor': np.bitwise_xor,
+        'bitwiseNot': np.invert,
+        'leftShift': np.left_shift,
+        'rightShift': np.right_shift,
+        'where': np.where,
+        'cast': np.asarray,
+    }
+
+    def asarray(self, data):
+        return np.asarray(data)
+
+    def numpy(self, data):
+        return np.asarray(data)
+
+    def cast(self, array, dtype):
+        return np.asarray(array).astype(dtype, copy=False)
+
+    def apply(self, operation, arrays, dtypes, dtype):
+        func = self._lookup(self._operations, operation)
+        arrays = [self.cast(array, array_dtype)
+                  for array, array_dtype in zip(arrays, dtypes)]
+        # Like TensorFlow, divisions by zero give inf/nan without warnings.
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            return self.cast(func(*arrays), dtype)
+
+
+class TensorflowBackend(Backend):
+    """Runs band operations with TensorFlow.
+
+    By default every operation is an eager op with its own result. With jit,
+    a whole kernel (e.g. NDVI over every band of an image) is traced into a
+    single tf.function compiled by XLA, so chains of elementwise operations
+    become one fused loop. Compiled functions are cached by program
+    signature and leaf shapes/dtypes, so every tile of the same shape reuses
+    them. Kernels with streaming reductions are not compiled: they would
+    hold every image of the collection at once.
+    """
+
+    name = 'tensorflow'
+
+    # The number of compiled functions kept by a backend.
+    MAX_COMPILED_KERNELS = 64
+
+    def __init__(self, jit=False):
+        """Creates the backend.
+
+        Args:
+          jit: Whether kernels are compiled with XLA.
+        """
+        import tensorflow as tf
+        self._tf = tf
+        try:
+            import tensorflow.experimental.numpy as tnp
+            self.xp = tnp
+        except ImportError:
+            # TensorFlow < 2.4, band math works but reducers do not.
+            self.xp = None
+        self._jit = jit
+        self._compiled = ge.cache.LRUCache(self.MAX_COMPILED_KERNELS)
+        self._operations = {
+            'add': tf.math.add,
+            'subtract': tf.math.subtract,
+            'multiply': tf.math.multiply,
+            'divide': tf.math.divide,
+            'eq': tf.math.equal,
+            'neq': tf.math.not_equal,
+            'gt': tf.math.greater,
+            'gte': tf.math.greater_equal,
+            'lt': tf.math.less,
+            'lte': tf.math.less_equal,
+            'max': tf.math.maximum,
+            'min': tf.math.minimum,
+            'matrixMultiply': tf.math.matmul,
+            'exp': tf.math.exp,
+            'log': tf.math.log,
+            'pow': tf.math.pow,
+            'mod': tf.math.truncatemod,
+            'abs': tf.math.abs,
+            'sqrt': tf.math.sqrt,
+            'floor': tf.math.floor,
+            'ceil': tf.math.ceil,
+            'and': tf.math.logical_and,
+            'or': tf.math.logical_or,
+            'not': tf.math.logical_not,
+            'bitwiseAnd': tf.bitwise.bitwise_and,
+            'bitwiseOr': tf.bitwise.bitwise_or,
+            'bitwiseXor': tf.bitwise.bitwise_xor,
+            'bitwiseNot': tf.bitwise.invert,
+            'leftShift': tf.bitwise.left_shift,
+            'rightShift': tf.bitwise.right_shift,
+            'where': tf.where,
+            'cast': tf.identity,
+        }
+
+    def __getstate__(self):
+        # Modules and TF functions do not pickle, workers import them again.
+        return {'jit': self._jit}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    def asarray(self, data):
+        return self._tf.convert_to_tensor(data)
+
+    def numpy(self, data):
+        if isinstance(data, np.ndarray):
+            return data
+        return data.numpy()
+
+    def cast(self, array, dtype):
+        return self._tf.cast(array, dtype)
+
+    def apply(self, operation, arrays, dtypes, dtype):
+        func = self._lookup(self._operations, operation)
+        kind = np.dtype(dtype).kind
+        if (operation in ('floor', 'ceil') and kind in 'biu' or
+                operation == 'abs' and kind in 'bu'):
+            # TensorFlow has no integer floor/ceil nor unsigned abs, which
+            # leave their operand unchanged.
+            func = self._tf.identity
+        arrays = [self.cast(array, array_dtype)
+                  for array, array_dtype in zip(arrays, dtypes)]
+        return self.cast(func(*arrays), dtype)
+
+    def run(self, program, load):
+        # A compiled function takes every leaf at once, so streaming
+        # reductions, which load one image at a time, run eagerly.
+        if not self._jit or any(kind == 'accumulate'
+                                for kind, _, _, _, _ in program.steps):
+            return program.execute(self, load)
+
+        leaves = [load(index)
+                  for kind, index, _, _, _ in program.steps if kind == 'load']
+        # Masks are extra arguments of the function, for the leaves that
+        # have one.
+        masked = tuple(mask is not None for _, mask in leaves)
+        arrays = [array for leaf in leaves for array in leaf
+                  if array is not None]
+        specs = tuple((tuple(array.shape), array.dtype) for array in arrays)
+        key = (program.signature(), specs, masked)
+
+        func = self._compiled.get(key)
+        if func is None:
+            func = self._compile(program, specs, masked)
+            self._compiled.put(key, func)
+        return func(*arrays)
+
+    def _compile(self, program, specs, masked):
+        tf = self._tf
+
+        def kernel(*arrays):
+            arrays = iter(arrays)
+            leaves = [(next(arrays), next(arrays) if leaf_masked else None)
+                      for leaf_masked in masked]
+            return program.execute(self, lambda index: leaves[index])
+
+        input_signature = [tf.TensorSpec(shape, dtype)
+                           for shape, dtype in specs]
+        try:
+            return tf.function(kernel, input_signature=input_signature,
+                               jit_compile=True)
+        except TypeError:
+            # TensorFlow < 2.5 names the option experimental_compile.
+            return tf.function(kernel, input_signature=input_signature,
+                               experimental_compile=True)
+
+
+_BACKENDS = {
+    NumpyBackend.name: NumpyBackend,
+    TensorflowBackend.name: TensorflowBackend,
+}
+
+# The backend of the process, set by use() or on first use by current().
+_backend = None
+
+
+def use(backend, **options):
+    """Sets the backend used by the process.
+
+    Args:
+      backend: A backend name ('numpy' or 'tensorflow') or a Backend.
+      **options: Options of the backend constructor, e.g.
+          use('tensorflow', jit=True).
+    """
+    global _backend
+    if isinstance(backend, Backend):
+        _backend = backend
+    elif backend in _BACKENDS:
+        _backend = _BACKENDS[backend](**options)
+    else:
+        raise ge.ee_exception.EEException(
+            'Unknown backend: {backend}'.format(backend=backend))
+
+
+def current():
+    """Returns the backend used by the process."""
+    if _backend is None:
+        use(os.environ.get('GE_BACKEND') or _default())
+    return _backend
+
+
+def _default():
+    """TensorFlow if it is already imported and sees a GPU, NumPy
+    otherwise."""
+    tf = sys.modules.get('tensorflow')
+    if tf is None:
+        return NumpyBackend.name
+    if tf.config.experimental.list_physical_devices('GPU'):
+        return TensorflowBackend.name
+    return NumpyBackend.name
@@ -1,27 +1,36 @@
 import json
 import os
 import tempfile
-import random
+
+import numpy as np
+
+import ge.dtypes
 from ge.db import models
+from ge.executor import Executor
+from ge.tools import SRS
+
+from osgeo import gdal, ogr
+
+# Band interleaved files let a later select() decode only the bands it
+# keeps, pixel interleaved blocks hold (and decompress) every band at once.
+GTIFF_CREATION_OPTIONS = ['INTERLEAVE=BAND']
 
-from osgeo import gdal, osr, ogr
 
 class Export():
     class image(object):
         @staticmethod
-        def toLocalDisk(image, fileNamePrefix):
-            dataset = Export.image.__build_dataset(image)
+        def toLocalDisk(image, fileNamePrefix, tileSize=None, workers=None,
+                        pool=None):
+            dataset = Export.image.__build_dataset(image, fileNamePrefix,
+                                                   tileSize, workers, pool)
+            dataset.FlushCache()
+            dataset = None
             print("imagem computada com sucesso")
-
-            gdal.Translate(fileNamePrefix, dataset, format='GTiff')
-
             print("imagem salva com sucesso")
 
         @staticmethod
-        def toDatabase(image, fileNamePrefix):
-            dataset = Export.image.__build_dataset(image)
-            print("imagem computada com sucesso")
-
+        def toDatabase(image, fileNamePrefix, tileSize=None, workers=None,
+                       pool=None):
             words = fileNamePrefix.split("/")
 
             filename = words[-1]
@@ -43,8 +52,8 @@ class Export():
                 properties=image.properties().getInfo()
             )
 
-            image = models.Image.objects(imageCollection=imageCollection.id,
-                                         path=filename).first()
+            image_document = models.Image.objects(
+                imageCollection=imageCollection.id, path=filename).first()
 
             with tempfile.TemporaryDirectory() as tmpdirname:
                 tmpfilename = "{dir}{sep}{filename}".format(
@@ -52,24 +61,35 @@ class Export():
                     sep=os.sep,
                     filename=filename
                 )
-                gdal.Translate(tmpfilename, dataset, format='GTiff')
+                dataset = Export.image.__build_dataset(image, tmpfilename,
+                                                       tileSize, workers,
+                                                       pool)
+                dataset.FlushCache()
+                dataset = None
+                print("imagem computada com sucesso")
+
                 file = open(tmpfilename, "rb")
-                image.file.replace(file, content_type='image/tiff')
-                image.save()
+                image_document.file.replace(file, content_type='image/tiff')
+                image_document.save()
 
         @staticmethod
-        def __build_dataset(image):
-            image = image.getInfo()
-
-            fileNamePrefix = "/vsimem/{hash}".format(
-                hash=random.getrandbits(128))
-            first_band = image.getBands().get(0)
-            cols = first_band.getCols()
-            rows = first_band.getRows()
+        def __build_dataset(image, fileName, tileSize=None, workers=None,
+                            pool=None):
+            """
+            Creates the GeoTIFF fileName and streams the image into it tile
+            by tile, so the image is never held in memory as a whole. Tiles
+            are computed by a pool of workers (see ge.executor).
+            """
+            executor = Executor(image, tileSize, workers, pool)
+
+            first_band = executor.bands()[0]
+            cols = executor.cols()
+            rows = executor.rows()
             projection = first_band.getCRS()
             transform = first_band.getTransform()
-            band_type = first_band.getType()
-
+            # One type for the whole file, holding the values of every band.
+            band_type = ge.dtypes.toGdal(ge.dtypes.union(
+                [band.getDataType() for band in executor.bands()]))
 
             print("Exporting file with:\n"
                   "Cols:{cols}\n"
@@ -82,24 +102,72 @@ class Export():
                                        transform=str(transform),
                                        band_type=str(band_type)))
 
-            driver = gdal.GetDriverByName('MEM')
+            # The file blocks match the tiles, so that each tile fills whole
+            # blocks. Tiles shifted to the blocks of the source (e.g. after a
+            # clip) would straddle up to 4 blocks, the file then keeps the
+            # default layout of GDAL.
+            tile_cols, tile_rows = executor.tileSize()
+            options = list(GTIFF_CREATION_OPTIONS)
+            if (executor.aligned() and tile_cols % 16 == 0 and
+                    tile_rows % 16 == 0):
+                options += ['TILED=YES',
+                            'BLOCKXSIZE={}'.format(tile_cols),
+                            'BLOCKYSIZE={}'.format(tile_rows)]
+
+            driver = gdal.GetDriverByName('GTiff')
 
             dataset = driver.Create(
-                fileNamePrefix,
+                fileName,
                 cols,
                 rows,
-                image.getBands().length(),
-                band_type
+                len(executor.bands()),
+                band_type,
+                options
             )
 
             dataset.SetGeoTransform(transform)
             dataset.SetProjection(projection)
-            for band_index, band in enumerate(image.getBands()):
-                print("***********************************")
-                print("Cols: {} Rows: {}".format(band.getCols(),
-                                                 band.getRows()))
-                print("***********************************")
-                dataset.GetRasterBand(band_index + 1).WriteArray(band.getData())
+
+            dtype = ge.dtypes.toNumpy(band_type)
+            band_list = list(range(1, len(executor.bands()) + 1))
+
+            # Masked pixels are written as the nodata value of their band.
+            # If a band that may be masked has none, the file gets a mask
+            # band instead, shared by every band.
+            maskable = executor.maskable()
+            nodatas = [band.getNoData() if masked else None
+                       for band, masked in zip(executor.bands(), maskable)]
+            for band_number, nodata in zip(band_list, nodatas):
+                if nodata is not None:
+                    dataset.GetRasterBand(band_number).SetNoDataValue(nodata)
+            mask_band = None
+            if any(masked and nodata is None
+                   for masked, nodata in zip(maskable, nodatas)):
+                dataset.CreateMaskBand(gdal.GMF_PER_DATASET)
+                mask_band = dataset.GetRasterBand(1).GetMaskBand()
+
+            def write(window, arrays, masks):
+                # The bands of a tile are written by one GDAL call, from one
+                # contiguous (bands, rows, cols) array.
+                xoff, yoff, xsize, ysize = window
+                tile = np.empty((len(arrays), ysize, xsize), dtype=dtype)
+                for band_index, data in enumerate(arrays):
+                    tile[band_index] = data
+                    mask = masks[band_index]
+                    if mask is not None and nodatas[band_index] is not None:
+                        np.copyto(tile[band_index], nodatas[band_index],
+                                  casting='unsafe', where=~mask)
+                dataset.WriteRaster(xoff, yoff, xsize, ysize, tile.data,
+                                    buf_type=band_type, band_list=band_list)
+
+                if mask_band is not None:
+                    valid = np.full((ysize, xsize), 255, dtype=np.uint8)
+                    for mask in masks:
+                        if mask is not None:
+                            valid[~mask] = 0
+                    mask_band.WriteArray(valid, xoff, yoff)
+
+            executor.run(write)
             return dataset
 
         @staticmethod
@@ -139,10 +207,8 @@ class Export():
             driver = ogr.GetDriverByName("ESRI Shapefile")
             data_source = driver.CreateDataSource(fileNamePrefix)
 
-            srs = osr.SpatialReference()
-            srs.ImportFromEPSG(4326)
-
-            data_source.CreateLayer("volcanoes", srs, ogr.wkbPoint)
+            data_source.CreateLayer("volcanoes", SRS.Get('EPSG:4326'),
+                                    ogr.wkbPoint)
             data_source.Destroy()
 
         @staticmethod
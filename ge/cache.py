@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+"""A bounded, thread-safe cache."""
+
+import collections
+import threading
+
+
+class LRUCache(object):
+    """A mapping that evicts its least recently used entries.
+
+    The cache is bounded by its number of entries and, optionally, by the
+    total size of its values. It counts its hits and misses, see stats().
+    All operations are guarded by a lock, so one cache can be shared by the
+    worker threads of an executor.
+    """
+
+    def __init__(self, maxsize=128, maxbytes=None, sizeof=None):
+        """Creates a cache.
+
+        Args:
+          maxsize: The number of entries kept.
+          maxbytes: Optional total size of the values kept, in bytes.
+              Values larger than that are not cached.
+          sizeof: A function returning the size of a value in bytes, by
+              default its nbytes (e.g. for numpy arrays). Only used with
+              maxbytes.
+        """
+        self._maxsize = maxsize
+        self._maxbytes = maxbytes
+        self._sizeof = sizeof or (lambda value: value.nbytes)
+        self._entries = collections.OrderedDict()
+        self._sizes = {}
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            if key not in self._entries:
+                self._misses += 1
+                return default
+            self._hits += 1
+            self._entries.move_to_end(key)
+            return self._entries[key]
+
+    def put(self, key, value):
+        size = self._sizeof(value) if self._maxbytes is not None else 0
+        with self._lock:
+            self._remove(key)
+            if self._maxbytes is not None and size > self._maxbytes:
+                return
+            self._entries[key] = value
+            self._sizes[key] = size
+            self._bytes += size
+            while (len(self._entries) > self._maxsize or
+                   (self._maxbytes is not None and
+                    self._bytes > self._maxbytes)):
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        if key in self._entries:
+            del self._entries[key]
+            self._bytes -= self._sizes.pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._sizes.clear()
+            self._bytes = 0
+
+    def stats(self):
+        """Returns the hits, misses, entries and bytes of the cache."""
+        with self._lock:
+            return {'hits': self._hits, 'misses': self._misses,
+                    'entries': len(self._entries), 'bytes': self._bytes}
+
+    def __contains__(self, key):
+        with self._lock:
+            return key in self._entries
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
@@ -0,0 +1,220 @@
+#!/usr/bin/env python
+"""Pixel types of bands and the type promotion rules of band operations.
+
+Bands keep the numpy dtype of their pixels, so uint8 QA bands and uint16
+reflectance bands stay that small through the pipeline. Each operation
+states the dtype its operands are converted to and the dtype of its result,
+in terms of the union of the operand types: the widest float type if an
+operand is a float (int32 and float32 give float32, not float64 as in
+numpy), the smallest integer type holding both ranges otherwise.
+  add, multiply: the union, integers widened one size unless every result
+      the operand types (and the values of constant operands) can give
+      fits in the union, so that sums and products do not wrap around:
+      uint16 + uint16 gives uint32, uint8 + 10 gives uint16, but
+      uint16 * 1 stays uint16.
+  subtract: the union, integers widened to a signed type (uint16 - uint16
+      gives int32, so NIR - RED keeps its sign).
+Integers are only widened up to 32 bits (64 bits for the signed result of
+subtracting uint32 bands), so chains of operations do not reach 64-bit
+types, which GDAL stores as float64.
+  max, min, mod, matrixMultiply, abs: the union.
+  divide, pow, exp, log, sqrt: float32, or float64 if an operand is.
+  floor, ceil: the operand type.
+  eq, neq, gt, gte, lt, lte: compared in the union type, bool result.
+  and, or, not: bool.
+  bitwiseAnd, bitwiseOr, bitwiseXor, bitwiseNot, leftShift, rightShift:
+      the union, which must be an integer type.
+  where: the union of the value and input types, tested as bool.
+  updateMask: the input type, the mask is tested as bool.
+  unmask: the union of the input and value types.
+  mask: uint8.
+Bool operands count as uint8 in arithmetic.
+"""
+
+import numpy as np
+from osgeo import gdal
+from osgeo import gdal_array
+
+import ge.ee_exception
+
+_GDAL_TYPES = {
+    np.dtype(np.bool_): gdal.GDT_Byte,
+    np.dtype(np.uint8): gdal.GDT_Byte,
+    np.dtype(np.int8): gdal.GDT_Int16,
+    np.dtype(np.uint16): gdal.GDT_UInt16,
+    np.dtype(np.int16): gdal.GDT_Int16,
+    np.dtype(np.uint32): gdal.GDT_UInt32,
+    np.dtype(np.int32): gdal.GDT_Int32,
+    np.dtype(np.uint64): gdal.GDT_Float64,
+    np.dtype(np.int64): gdal.GDT_Float64,
+    np.dtype(np.float32): gdal.GDT_Float32,
+    np.dtype(np.float64): gdal.GDT_Float64,
+}
+
+_NUMPY_TYPES = {
+    gdal.GDT_Byte: np.dtype(np.uint8),
+    gdal.GDT_UInt16: np.dtype(np.uint16),
+    gdal.GDT_Int16: np.dtype(np.int16),
+    gdal.GDT_UInt32: np.dtype(np.uint32),
+    gdal.GDT_Int32: np.dtype(np.int32),
+    gdal.GDT_Float32: np.dtype(np.float32),
+    gdal.GDT_Float64: np.dtype(np.float64),
+}
+# Types of newer GDAL versions: Int64 and UInt64 (3.5), Int8 (3.7).
+for _name, _dtype in (('GDT_Int8', np.int8), ('GDT_Int64', np.int64),
+                      ('GDT_UInt64', np.uint64)):
+    if hasattr(gdal, _name):
+        _NUMPY_TYPES[getattr(gdal, _name)] = np.dtype(_dtype)
+
+_WIDENED = frozenset(['add', 'multiply'])
+_UNION = frozenset(['max', 'min', 'mod', 'matrixMultiply', 'abs'])
+_FLOAT = frozenset(['divide', 'pow', 'exp', 'log', 'sqrt'])
+_SAME = frozenset(['floor', 'ceil'])
+_COMPARISON = frozenset(['eq', 'neq', 'gt', 'gte', 'lt', 'lte'])
+_LOGICAL = frozenset(['and', 'or', 'not'])
+_BITWISE = frozenset(['bitwiseAnd', 'bitwiseOr', 'bitwiseXor', 'bitwiseNot',
+                      'leftShift', 'rightShift'])
+
+BOOL = np.dtype(np.bool_)
+
+
+def toNumpy(type):
+    """Returns the numpy dtype of a GDAL type code or numpy type."""
+    if type is None:
+        return None
+    if isinstance(type, int) and not isinstance(type, bool):
+        if type in _NUMPY_TYPES:
+            return _NUMPY_TYPES[type]
+        # Any other type GDAL knows a numpy type for.
+        numeric_type = gdal_array.GDALTypeCodeToNumericTypeCode(type)
+        if numeric_type is None:
+            raise ge.ee_exception.EEException(
+                'Unsupported GDAL type: {type}'.format(type=type))
+        return np.dtype(numeric_type)
+    return np.dtype(type)
+
+
+def toGdal(dtype):
+    """Returns the GDAL type code pixels of a numpy dtype are stored as."""
+    return _GDAL_TYPES[np.dtype(dtype)]
+
+
+def storage(dtype):
+    """Returns the numpy dtype pixels of a dtype are written to GDAL as."""
+    return toNumpy(toGdal(dtype))
+
+
+def ofConstant(value):
+    """Returns the smallest dtype holding a constant.
+
+    Integers take the smallest integer type holding them, so that they do
+    not widen the bands they are combined with by themselves; floats are
+    float32.
+    """
+    if isinstance(value, bool):
+        return BOOL
+    if isinstance(value, int):
+        return np.min_scalar_type(value)
+    return np.dtype(np.float32)
+
+
+def union(dtypes):
+    """Returns the type holding the values of all the given types."""
+    dtypes = [np.dtype(np.uint8) if dtype == BOOL else np.dtype(dtype)
+              for dtype in dtypes]
+    floats = [dtype for dtype in dtypes if dtype.kind == 'f']
+    return np.result_type(*(floats or dtypes))
+
+
+def _bounds(dtype, value=None):
+    """Returns the (lowest, highest) values of an integer type, or of a
+    constant of that type."""
+    if value is not None:
+        return value, value
+    info = np.iinfo(np.uint8 if dtype == BOOL else dtype)
+    return int(info.min), int(info.max)
+
+
+def _fits(operation, dtypes, constants, dtype):
+    """Returns whether every result of add or multiply on integer operands
+    fits in an integer type."""
+    low, high = _bounds(dtypes[0], constants[0])
+    for operand_type, value in zip(dtypes[1:], constants[1:]):
+        other_low, other_high = _bounds(operand_type, value)
+        if operation == 'add':
+            low, high = low + other_low, high + other_high
+        else:
+            products = [low * other_low, low * other_high,
+                        high * other_low, high * other_high]
+            low, high = min(products), max(products)
+    info = np.iinfo(dtype)
+    return info.min <= low and high <= info.max
+
+
+def _widen(dtype, signed=False):
+    if dtype.kind not in 'iu' or dtype.itemsize >= 8:
+        return dtype
+    kind = 'i' if signed or dtype.kind == 'i' else 'u'
+    if dtype.itemsize >= 4 and kind == dtype.kind:
+        return dtype
+    return np.dtype('{kind}{size}'.format(kind=kind, size=dtype.itemsize * 2))
+
+
+def promote(operation, dtypes, constants=None):
+    """Returns the types an operation computes with.
+
+    Args:
+      operation: The name of the operation.
+      dtypes: The dtypes of the operands.
+      constants: Optional values, per operand, of the operands that are
+          constants (0-d bands), None for the other operands.
+
+    Returns:
+      A (operand dtypes, result dtype) tuple. The result is None for
+      operations whose result type is set by the caller (cast).
+    """
+    dtypes = [np.dtype(dtype) for dtype in dtypes]
+
+    if operation == 'cast':
+        return dtypes, None
+    if operation == 'where':
+        result = union(dtypes[1:])
+        return [BOOL, result, result], result
+    if operation == 'updateMask':
+        return dtypes, dtypes[0]
+    if operation == 'unmask':
+        result = union(dtypes)
+        return [result, result], result
+    if operation == 'mask':
+        return dtypes, np.dtype(np.uint8)
+    if operation in _LOGICAL:
+        return [BOOL] * len(dtypes), BOOL
+    if operation in _COMPARISON:
+        return [union(dtypes)] * len(dtypes), BOOL
+    if operation in _WIDENED:
+        result = union(dtypes)
+        constants = constants or [None] * len(dtypes)
+        if result.kind in 'iu' and not _fits(operation, dtypes, constants,
+                                             result):
+            result = _widen(result)
+        return [result] * len(dtypes), result
+    if operation == 'subtract':
+        result = _widen(union(dtypes), signed=True)
+        return [result] * len(dtypes), result
+    if operation in _UNION:
+        result = union(dtypes)
+        return [result] * len(dtypes), result
+    if operation in _FLOAT:
+        result = union([np.float32] + dtypes)
+        return [result] * len(dtypes), result
+    if operation in _SAME:
+        return dtypes, union(dtypes)
+    if operation in _BITWISE:
+        result = union(dtypes)
+        if result.kind not in 'iu':
+            raise ge.ee_exception.EEException(
+                '{operation} needs integer bands, got {dtype}.'.format(
+                    operation=operation, dtype=result))
+        return [result] * len(dtypes), result
+    raise ge.ee_exception.EEException(
+        'Unknown operation: {operation}'.format(operation=operation))
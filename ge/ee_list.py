@@ -1,71 +1,144 @@
 import functools
+import itertools
+import threading
+
+import numpy as np
 
 import ge.computedobject
 
 
 class List(ge.computedobject.ComputedObject):
+    """
+    An immutable list.
+
+    Lists are views (start, end) of a Python list that several of them
+    share, so copy(), slice() and get() are O(1). add() appends to the
+    shared list in place when the list ends where the shared list does
+    (which is always the case for the last list of a chain of adds), and
+    only copies its elements otherwise. Building a list with n adds is then
+    O(n), and no list ever sees the elements appended by another one.
+    """
+
+    # Guards the check-and-append of add() on shared lists.
+    _lock = threading.Lock()
+
     def __init__(self, elements=[], **kwargs):
         self._elements = list(elements)
+        self._start = 0
+        self._end = len(self._elements)
         self.__dict__.update(kwargs)
 
-    def add(self, element):
-        list = self.copy()
-        list._elements.append(element)
+    @staticmethod
+    def _view(elements, start, end):
+        list = List.__new__(List)
+        list._elements = elements
+        list._start = start
+        list._end = end
         return list
 
+    def add(self, element):
+        with List._lock:
+            if self._end == len(self._elements):
+                self._elements.append(element)
+                return List._view(self._elements, self._start, self._end + 1)
+        elements = self._elements[self._start:self._end]
+        elements.append(element)
+        return List._view(elements, 0, len(elements))
+
+    def cat(self, other):
+        """
+        Returns the concatenation of this list and another list or iterable.
+        """
+        other = list(other)
+        with List._lock:
+            if self._end == len(self._elements):
+                self._elements.extend(other)
+                return List._view(self._elements, self._start,
+                                  self._end + len(other))
+        elements = self._elements[self._start:self._end] + other
+        return List._view(elements, 0, len(elements))
+
     def get(self, index):
-        return self._elements[index]
+        length = self._end - self._start
+        if index < 0:
+            index += length
+        if not 0 <= index < length:
+            raise IndexError('List index out of range')
+        return self._elements[self._start + index]
 
     def iterate(self, function, first):
         pass
 
     def reduce(self, reducer):
-        from ge.image import Image, Band
-        first_element = self._elements[0]
+        from ge.image import Image
+        from ge.imagecollection import ImageCollection
+        from ge.reducer import Reducer
+        elements = self.getInfo()
+        first_element = elements[0]
         if isinstance(first_element, Image):
-            new_image = Image()
-            new_image = first_element.copyProperties(new_image)
-            for band_index, band in enumerate(first_element.getBands()):
-                band_data = []
-
-                for image in self._elements:
-                    image_band = image.getBands().get(band_index)
-                    band_data.append(image_band.getData())
-
-                band_data = functools.reduce(lambda x, y: reducer(x, y),
-                                             band_data)
-                new_band = Band(name=band.getName(), type=band.getType(),
-                                data=band_data)
-                new_band = band.copyProperties(new_band)
-                new_image = new_image.addBand(new_band)
-            return new_image
+            return ImageCollection(elements).reduce(reducer)
+        elif isinstance(reducer, Reducer):
+            # Numbers are reduced as a stack of 0-d bands.
+            values, _ = reducer.reduce(np, np.asarray(elements))
+            return values[0] if len(values) == 1 else values
         else:
             element = functools.reduce(lambda x, y: reducer(x, y),
-                                       self._elements)
+                                       elements)
             return element
 
     def insert(self, index, element):
-        list = self.copy()
-        list._elements[index] = element
-        return list
+        elements = self.getInfo()
+        elements[index] = element
+        return List._view(elements, 0, len(elements))
 
     def length(self):
-        return len(self._elements)
+        return self._end - self._start
 
     def slice(self, start, end):
-        list = self.copy()
-        list._elements = self._elements[start: end]
-        return list
+        indices = range(self._start, self._end)[start:end]
+        return List._view(self._elements, indices.start,
+                          max(indices.start, indices.stop))
+
+    def __len__(self):
+        return self.length()
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            if index.step not in (None, 1):
+                return List(self.getInfo()[index])
+            return self.slice(index.start, index.stop)
+        return self.get(index)
 
     def __iter__(self):
-        return iter(self._elements)
+        return itertools.islice(self._elements, self._start, self._end)
 
     def copy(self):
-        return List(self._elements, **self.__dict__)
+        return List._view(self._elements, self._start, self._end)
+
+    def _state(self):
+        # The visible elements, not the list shared with other views, and
+        # the other attributes.
+        state = dict((key, value) for key, value in self.__dict__.items()
+                     if key not in ('_elements', '_start', '_end'))
+        state['_elements'] = self.getInfo()
+        return state
+
+    def __eq__(self, other):
+        # pylint: disable=unidiomatic-typecheck
+        return type(self) == type(other) and self._state() == other._state()
+
+    def __hash__(self):
+        return hash(ge.computedobject.ComputedObject.freeze(self._state()))
+
+    def getInfo(self):
+        """
+        Returns the elements, as a new Python list.
+        """
+        return self._elements[self._start:self._end]
 
     def encode(self, opt_encoder=None):
         if self._elements is not None:
-            return opt_encoder(self._elements)
+            return opt_encoder(self.getInfo())
         else:
             return super(List, self).encode(opt_encoder)
 
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+"""Tiled, streaming execution of image expressions."""
+
+import collections
+import concurrent.futures
+import os
+
+import numpy as np
+
+import ge.backend
+import ge.ee_exception
+import ge.kernel
+
+# Tile size used when no band of the image is read from a blocked source.
+DEFAULT_TILE_SIZE = (512, 512)
+
+# Blocks smaller than this (e.g. the one row strips of an untiled GeoTIFF)
+# are grouped into taller tiles, so each tile amortizes its evaluation.
+MIN_TILE_PIXELS = 256 * 256
+
+# Number of tiles computed at once when an executor does not set it.
+DEFAULT_WORKERS = os.cpu_count() or 1
+
+# Either 'thread' or 'process'. GDAL reads and the TF/NumPy kernels release
+# the GIL, so threads are enough for most expressions; pure Python kernels
+# may need processes.
+DEFAULT_POOL = 'thread'
+
+# The executor of the current worker process, set by _initializeWorker.
+_worker_executor = None
+
+
+class Executor(object):
+    """Evaluates the bands of an image block by block.
+
+    The output grid is split into tiles aligned with the blocks of the first
+    source read by the expression, and the whole expression is evaluated for
+    one tile at a time. Memory is bounded by the tile size times the depth of
+    the expression, whatever the size of the image.
+    """
+
+    def __init__(self, image, tileSize=None, workers=None, pool=None):
+        """Creates an executor.
+
+        Args:
+          image: The image to compute.
+          tileSize: Optional (cols, rows) of the tiles. Defaults to the block
+              size of the sources read by the image.
+          workers: Optional number of tiles computed in parallel. Defaults to
+              DEFAULT_WORKERS, 1 computes every tile in the calling thread.
+          pool: Optional kind of pool, 'thread' or 'process'. Defaults to
+              DEFAULT_POOL.
+        """
+        self._workers = workers or DEFAULT_WORKERS
+        self._pool = pool or DEFAULT_POOL
+        if self._pool not in ('thread', 'process'):
+            raise ValueError("Unknown pool: {pool}".format(pool=self._pool))
+
+        self._bands = list(image.getBands())
+        self._kernel = ge.kernel.Kernel(self._bands)
+        if self._pool == 'process' and self._workers > 1:
+            self._checkSources()
+
+        grid = next((band for band in self._bands
+                     if band.getCols() is not None), self._bands[0])
+        self._cols = grid.getCols()
+        self._rows = grid.getRows()
+
+        self._offset = (0, 0)
+        if tileSize is None:
+            tileSize = self._blockSize()
+        self._tileSize = tileSize
+
+    def _checkSources(self):
+        """Raises an EEException if a source of the image cannot be read by
+        worker processes, e.g. a warped VRT in /vsimem."""
+        for band in self._kernel.leaves():
+            source = band.getSource()
+            if source is not None and source.inMemory():
+                raise ge.ee_exception.EEException(
+                    "Band {name} is read from an in-memory dataset ({path}), "
+                    "which worker processes cannot open: use pool='thread' "
+                    "or write the dataset to a file first.".format(
+                        name=band.getName(), path=source.path() or 'MEM'))
+
+    def _blockSize(self):
+        """Returns the block size of the first blocked source of the image,
+        recording the offset of the image grid in that source."""
+        for band in self._kernel.leaves():
+            source = band.getSource()
+            if source is None:
+                continue
+            xoff, yoff, _, _ = band.getWindow()
+            self._offset = (xoff, yoff)
+
+            block_cols, block_rows = source.blockSize()
+            block_cols = min(block_cols, self._cols)
+            if block_cols * block_rows < MIN_TILE_PIXELS:
+                block_rows *= -(-MIN_TILE_PIXELS // (block_cols * block_rows))
+            return block_cols, min(block_rows, self._rows)
+        return DEFAULT_TILE_SIZE
+
+    def cols(self):
+        return self._cols
+
+    def rows(self):
+        return self._rows
+
+    def tileSize(self):
+        return self._tileSize
+
+    def bands(self):
+        return self._bands
+
+    def aligned(self):
+        """Returns whether the tiles start at the first row and column of
+        the image, and so match blocks of the tile size from there."""
+        tile_cols, tile_rows = self._tileSize
+        return (self._offset[0] % tile_cols == 0 and
+                self._offset[1] % tile_rows == 0)
+
+    def windows(self):
+        """Yields the (xoff, yoff, xsize, ysize) windows covering the image.
+
+        Tile edges fall on the block edges of the source, so a tile never
+        reads a source block partially when the image is offset in it.
+        """
+        tile_cols, tile_rows = self._tileSize
+        x_shift = self._offset[0] % tile_cols
+        y_shift = self._offset[1] % tile_rows
+
+        for y in range(-y_shift, self._rows, tile_rows):
+            yoff = max(y, 0)
+            ysize = min(y + tile_rows, self._rows) - yoff
+            for x in range(-x_shift, self._cols, tile_cols):
+                xoff = max(x, 0)
+                xsize = min(x + tile_cols, self._cols) - xoff
+                yield (xoff, yoff, xsize, ysize)
+
+    def maskable(self):
+        """Returns, per band, whether it may have masked pixels."""
+        return self._kernel.maskable()
+
+    def compute(self, window):
+        """Returns the data and the masks of every band for a window.
+
+        Returns:
+          An (arrays, masks) tuple of lists with one numpy array per band.
+          A mask is None if every pixel of the band is valid in the window,
+          else a bool array, False at the masked pixels.
+        """
+        xsize, ysize = window[2], window[3]
+        backend = ge.backend.current()
+        arrays = []
+        masks = []
+        for data, mask in self._kernel.evaluate(window):
+            data = backend.numpy(data)
+            if data.dtype == np.bool_:
+                # GDAL has no bool type, masks are written as Byte.
+                data = data.view(np.uint8)
+            if data.ndim < 2:
+                data = np.broadcast_to(data, (ysize, xsize))
+            arrays.append(data)
+            if mask is not None:
+                mask = np.broadcast_to(backend.numpy(mask), (ysize, xsize))
+            masks.append(mask)
+        return arrays, masks
+
+    def run(self, write):
+        """Evaluates the image tile by tile.
+
+        Tiles are computed by the worker pool but always written from the
+        calling thread, in the order of windows(), so the result does not
+        depend on the number of workers. At most two tiles per worker are
+        in flight, which keeps memory bounded when writes are slower than
+        the workers.
+
+        Args:
+          write: A function called with each window, the list of arrays
+              computed for it and the list of their masks, one per band (see
+              compute()).
+        """
+        if self._workers <= 1:
+            for window in self.windows():
+                write(window, *self.compute(window))
+            return
+
+        if self._pool == 'process':
+            pool = concurrent.futures.ProcessPoolExecutor(
+                self._workers, initializer=_initializeWorker,
+                initargs=(self, ge.backend.current()))
+            compute = _computeWorker
+        else:
+            pool = concurrent.futures.ThreadPoolExecutor(self._workers)
+            compute = self.compute
+
+        with pool:
+            pending = collections.deque()
+            for window in self.windows():
+                pending.append((window, pool.submit(compute, window)))
+                if len(pending) >= 2 * self._workers:
+                    window, future = pending.popleft()
+                    write(window, *future.result())
+            while pending:
+                window, future = pending.popleft()
+                write(window, *future.result())
+
+
+def _initializeWorker(executor, backend):
+    global _worker_executor
+    _worker_executor = executor
+    ge.backend.use(backend)
+
+
+def _computeWorker(window):
+    return _worker_executor.compute(window)
@@ -0,0 +1,211 @@
+#!/usr/bin/env python
+"""Band math formulas, as used by Image.expression()."""
+
+import ast
+import functools
+import sys
+
+import ge.ee_exception
+
+# Maximum number of parsed formulas kept.
+MAX_PARSED_EXPRESSIONS = 256
+
+_BINARY_OPERATORS = {
+    ast.Add: 'add',
+    ast.Sub: 'subtract',
+    ast.Mult: 'multiply',
+    ast.Div: 'divide',
+    ast.Pow: 'pow',
+    ast.Mod: 'mod',
+}
+
+_COMPARISONS = {
+    ast.Lt: 'lt',
+    ast.LtE: 'lte',
+    ast.Gt: 'gt',
+    ast.GtE: 'gte',
+    ast.Eq: 'eq',
+    ast.NotEq: 'neq',
+}
+
+_BOOLEAN_OPERATORS = {
+    ast.And: 'And',
+    ast.Or: 'Or',
+}
+
+# Functions that can be called in a formula, with their arity.
+_FUNCTIONS = {
+    'abs': 1,
+    'sqrt': 1,
+    'exp': 1,
+    'log': 1,
+    'floor': 1,
+    'ceil': 1,
+    'min': 2,
+    'max': 2,
+    'pow': 2,
+}
+
+
+@functools.lru_cache(maxsize=MAX_PARSED_EXPRESSIONS)
+def parse(expression):
+    """Parses a formula once, returning its syntax tree.
+
+    Args:
+      expression: A Python arithmetic expression, e.g.
+          "2.5 * (NIR - RED) / (NIR + 6 * RED - 7.5 * BLUE + 1)".
+
+    Returns:
+      The ast node of the expression.
+    """
+    try:
+        return ast.parse(expression, mode='eval').body
+    except SyntaxError as e:
+        raise ge.ee_exception.EEException(
+            'Invalid expression "{expression}": {error}'.format(
+                expression=expression, error=e))
+
+
+def build(expression, image, variables=None):
+    """Builds the deferred image computing a formula.
+
+    Nothing is computed here: the formula becomes the same graph of band
+    operations the Image methods would build, which a kernel then evaluates
+    in one pass per tile.
+
+    Args:
+      expression: The formula, see parse().
+      image: The image whose bands are referred to by name, or with b('name')
+          and b(index).
+      variables: Optional dictionary from names to images or numbers, looked
+          up before the bands of the image.
+
+    Returns:
+      The computed Image.
+    """
+    return _Builder(image, variables or {}).visit(parse(expression))
+
+
+class _Builder(object):
+    def __init__(self, image, variables):
+        self._image = image
+        self._variables = variables
+
+    def visit(self, node):
+        method = getattr(self, '_visit' + type(node).__name__, None)
+        if method is None:
+            raise ge.ee_exception.EEException(
+                'Unsupported syntax in expression: {node}'.format(
+                    node=type(node).__name__))
+        return method(node)
+
+    def _visitConstant(self, node):
+        return ge.Image(_number(_literal(node)))
+
+    # Literals before Python 3.8.
+    _visitNum = _visitStr = _visitNameConstant = _visitConstant
+
+    def _visitName(self, node):
+        if node.id in self._variables:
+            return ge.Image(self._variables[node.id])
+        return self._image.select(node.id)
+
+    def _visitBinOp(self, node):
+        name = _BINARY_OPERATORS.get(type(node.op))
+        if name is None:
+            raise ge.ee_exception.EEException(
+                'Unsupported operator in expression: {op}'.format(
+                    op=type(node.op).__name__))
+        left = self.visit(node.left)
+        return getattr(left, name)(self.visit(node.right))
+
+    def _visitUnaryOp(self, node):
+        if (isinstance(node.op, ast.USub) and
+                isinstance(node.operand, _LITERALS)):
+            return ge.Image(-_number(_literal(node.operand)))
+        operand = self.visit(node.operand)
+        if isinstance(node.op, ast.UAdd):
+            return operand
+        if isinstance(node.op, ast.USub):
+            # 0 - band gives a signed type one size up (uint16 gives
+            # int32), not the int64 of band * -1.
+            return ge.Image(0).subtract(operand)
+        if isinstance(node.op, ast.Not):
+            return operand.Not()
+        raise ge.ee_exception.EEException(
+            'Unsupported operator in expression: {op}'.format(
+                op=type(node.op).__name__))
+
+    def _visitCompare(self, node):
+        # a < b < c is (a < b) and (b < c).
+        result = None
+        left = self.visit(node.left)
+        for op, comparator in zip(node.ops, node.comparators):
+            name = _COMPARISONS.get(type(op))
+            if name is None:
+                raise ge.ee_exception.EEException(
+                    'Unsupported comparison in expression: {op}'.format(
+                        op=type(op).__name__))
+            right = self.visit(comparator)
+            comparison = getattr(left, name)(right)
+            result = comparison if result is None else result.And(comparison)
+            left = right
+        return result
+
+    def _visitBoolOp(self, node):
+        name = _BOOLEAN_OPERATORS[type(node.op)]
+        values = [self.visit(value) for value in node.values]
+        return functools.reduce(
+            lambda left, right: getattr(left, name)(right), values)
+
+    def _visitIfExp(self, node):
+        # "a if test else b" keeps a where test is nonzero. Built on a, the
+        # result is named after a, or after b if a is a constant.
+        return self.visit(node.body).where(self.visit(node.test).Not(),
+                                           self.visit(node.orelse))
+
+    def _visitCall(self, node):
+        if not isinstance(node.func, ast.Name) or node.keywords:
+            raise ge.ee_exception.EEException(
+                'Unsupported call in expression.')
+        name = node.func.id
+
+        if name == 'b':
+            if len(node.args) != 1 or not isinstance(node.args[0],
+                                                     _LITERALS):
+                raise ge.ee_exception.EEException(
+                    'b() takes a band name or index.')
+            return self._image.select(_literal(node.args[0]))
+
+        if _FUNCTIONS.get(name) != len(node.args):
+            raise ge.ee_exception.EEException(
+                'Unknown function in expression: {name}/{count}'.format(
+                    name=name, count=len(node.args)))
+        arguments = [self.visit(arg) for arg in node.args]
+        return getattr(arguments[0], name)(*arguments[1:])
+
+
+# The nodes of literals: ast.Constant since Python 3.8, ast.Num, ast.Str
+# and ast.NameConstant before.
+if sys.version_info >= (3, 8):
+    _LITERALS = (ast.Constant,)
+else:
+    _LITERALS = (ast.Num, ast.Str, ast.NameConstant)
+
+
+def _literal(node):
+    """Returns the value of a literal node, on any Python version."""
+    if sys.version_info < (3, 8) and isinstance(node, ast.Num):
+        return node.n
+    if sys.version_info < (3, 8) and isinstance(node, ast.Str):
+        return node.s
+    return node.value
+
+
+def _number(value):
+    """Returns a numeric literal, rejecting strings, bools and None."""
+    if isinstance(value, bool) or not isinstance(value, (int, float)):
+        raise ge.ee_exception.EEException(
+            'Unsupported constant in expression: {value!r}'.format(
+                value=value))
+    return value
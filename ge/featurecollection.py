@@ -1,14 +1,15 @@
-import json
 from urllib.parse import urlparse
 
 from osgeo import ogr
 
 import ge.apifunction
 import ge.element
+import ge.projection
 from ge.collection import Collection
 from ge.db import models
 from ge.ee_list import List
 from ge.geometry import Geometry
+from ge.tools import Vector
 
 
 class FeatureCollection(Collection):
@@ -64,14 +65,10 @@ class FeatureCollection(Collection):
 
         # load features
         for feature in layer:
-            feature_json = json.loads(feature.ExportToJson())
-
             feature_type = feature.GetGeometryRef().GetGeometryName()
-            feature_geometry = Geometry(
-                geo_json=feature.GetGeometryRef().ExportToJson(),
-                opt_proj=feature.GetGeometryRef().GetSpatialReference().ExportToWkt()
-            )
-            feature_properties = feature_json.get("properties")
+            feature_geometry = Geometry._wrap(
+                feature.GetGeometryRef().Clone())
+            feature_properties = feature.items()
 
             feature = Feature(type=feature_type, geometry=feature_geometry)
 
@@ -105,7 +102,7 @@ class FeatureCollection(Collection):
             for key, value in f.properties.items():
                 feature = feature.set(key, value)
 
-            vector._features.add(feature)
+            vector._features = vector._features.add(feature)
 
         return vector
 
@@ -115,11 +112,41 @@ class FeatureCollection(Collection):
         for feature in self._features:
             intersects = geometry.intersects(feature.geometry())
             if intersects:
-                features.add(feature)
+                features = features.add(feature)
 
         vector._features = features
         return vector
 
+    def transform(self, proj, maxError=None):
+        """
+        Transforms the geometries of the features to a specific projection.
+        The coordinates of all the geometries are transformed together, see
+        Vector.TransformGeometries().
+
+        :param proj: The target projection, as a ge.Projection, an
+        authority code (e.g. 'EPSG:4326') or a WKT string.
+        :param maxError: The maximum projection error.
+        """
+        if not isinstance(proj, ge.projection.Projection):
+            proj = ge.projection.Projection(proj)
+
+        features = list(self._features)
+        geometries = [feature.geometry() for feature in features]
+        transformed = Vector.TransformGeometries(
+            [geometry._geometry if geometry is not None else None
+             for geometry in geometries], proj.wkt())
+
+        vector = self.copy()
+        vector._features = List([])
+        for feature, geometry, ogr_geometry in zip(features, geometries,
+                                                   transformed):
+            if geometry is not None:
+                geometry = Geometry._wrap(ogr_geometry)
+            feature = feature.copy()
+            feature._geometry = geometry
+            vector._features = vector._features.add(feature)
+        return vector
+
     def compute(self):
         return self
 
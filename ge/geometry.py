@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 import json
 
-from osgeo import ogr, osr
+from osgeo import ogr
 
 import ge.apifunction
 import ge.computedobject
@@ -9,13 +9,16 @@ import ge.ee_exception
 import ge.ee_types
 import ge.projection
 import ge.serializer
-from ge.tools.vector import Vector
+from ge.tools import SRS, Vector
 
 
 class Geometry(ge.computedobject.ComputedObject):
     """
     https://pcjericks.github.io/py-gdalogr-cookbook/projection.html
     https://www.programcreek.com/python/example/58591/osgeo.osr.SpatialReference
+
+    Geometries are immutable: operations return new OGR geometries and
+    never modify the one of their input, so copies share it.
     """
 
     def __init__(self, geo_json='', opt_proj='', opt_geodesic=None,
@@ -38,13 +41,34 @@ class Geometry(ge.computedobject.ComputedObject):
                 if (not isinstance(opt_proj, ge.Projection)):
                     opt_proj = ge.Projection(opt_proj)
 
-                targetSR = osr.SpatialReference()
-                targetSR.ImportFromWkt(opt_proj.wkt())
-                self._geometry.AssignSpatialReference(targetSR)
+                self._geometry.AssignSpatialReference(
+                    SRS.Get(opt_proj.wkt()))
 
         else:
             self._geometry = None
 
+    def __setattr__(self, name, value):
+        if name == '_geometry' and '_geometry' in self.__dict__:
+            raise AttributeError('Geometry is immutable.')
+        super(Geometry, self).__setattr__(name, value)
+
+    @staticmethod
+    def _wrap(ogr_geometry, proj=None):
+        """
+        Returns a Geometry of an OGR geometry, which is not copied and must
+        not be modified afterwards.
+
+        :param ogr_geometry: The OGR geometry, or None.
+        :param proj: If specified, the projection assigned to the geometry.
+        """
+        geometry = Geometry()
+        if ogr_geometry is not None and proj:
+            if (not isinstance(proj, ge.Projection)):
+                proj = ge.Projection(proj)
+            ogr_geometry.AssignSpatialReference(SRS.Get(proj.wkt()))
+        geometry.__dict__['_geometry'] = ogr_geometry
+        return geometry
+
     @staticmethod
     def Point(coords=[], proj=None):
         point = ogr.Geometry(ogr.wkbPoint)
@@ -53,8 +77,7 @@ class Geometry(ge.computedobject.ComputedObject):
         elif len(coords) == 3:
             point.AddPoint(coords[0], coords[1], coords[2])
 
-        geometry = Geometry(point.ExportToJson(), proj)
-        return geometry
+        return Geometry._wrap(point, proj)
 
     @staticmethod
     def LineString(coords=[], proj=None):
@@ -70,8 +93,7 @@ class Geometry(ge.computedobject.ComputedObject):
             elif len(coord) == 3:
                 line.AddPoint(coord[0], coord[1], coord[2])
 
-        geometry = Geometry(line.ExportToJson(), proj)
-        return geometry
+        return Geometry._wrap(line, proj)
 
     @staticmethod
     def LinearRing(coords=[], proj=None):
@@ -93,12 +115,7 @@ class Geometry(ge.computedobject.ComputedObject):
             elif len(coord) == 3:
                 ring.AddPoint(coord[0], coord[1], coord[2])
 
-        if (proj):
-            geometry = Geometry(ring.ExportToJson(), proj)
-        else:
-            geometry = Geometry()
-            geometry._geometry = ring
-        return geometry
+        return Geometry._wrap(ring, proj)
 
     @staticmethod
     def Polygon(coords=[], proj=None):
@@ -107,12 +124,7 @@ class Geometry(ge.computedobject.ComputedObject):
         poly = ogr.Geometry(ogr.wkbPolygon)
         poly.AddGeometry(ring._geometry)
 
-        if (proj):
-            geometry = Geometry(poly.ExportToJson(), proj)
-        else:
-            geometry = Geometry()
-            geometry._geometry = poly
-        return geometry
+        return Geometry._wrap(poly, proj)
 
     @staticmethod
     def MultiLineString(coords=[], proj=None):
@@ -121,12 +133,7 @@ class Geometry(ge.computedobject.ComputedObject):
             line = Geometry.LineString(coord)
             multilinestring.AddGeometry(line._geometry)
 
-        if (proj):
-            geometry = Geometry(multilinestring.ExportToJson(), proj)
-        else:
-            geometry = Geometry()
-            geometry._geometry = multilinestring
-        return geometry
+        return Geometry._wrap(multilinestring, proj)
 
     @staticmethod
     def MultiPoint(coords=[], proj=None):
@@ -135,12 +142,7 @@ class Geometry(ge.computedobject.ComputedObject):
             point = Geometry.Point(coord)
             multipoint.AddGeometry(point._geometry)
 
-        if (proj):
-            geometry = Geometry(multipoint.ExportToJson(), proj)
-        else:
-            geometry = Geometry()
-            geometry._geometry = multipoint
-        return geometry
+        return Geometry._wrap(multipoint, proj)
 
     @staticmethod
     def MultiPolygon(coords=[], proj=None):
@@ -149,12 +151,7 @@ class Geometry(ge.computedobject.ComputedObject):
             polygon = Geometry.Polygon(coord)
             multipolygon.AddGeometry(polygon._geometry)
 
-        if (proj):
-            geometry = Geometry(multipolygon.ExportToJson(), proj)
-        else:
-            geometry = Geometry()
-            geometry._geometry = multipolygon
-        return geometry
+        return Geometry._wrap(multipolygon, proj)
 
     @staticmethod
     def Rectangle(coords=[], proj=None):
@@ -173,15 +170,11 @@ class Geometry(ge.computedobject.ComputedObject):
         Otherwise the distance is interpereted as meters and the buffering is performed in a
         spherical coordinate system.
         """
-        geometry = self.copy()
         if not proj:
             proj = self.projection()
 
-        geometry = geometry.transform(proj)
-        geometry_buffered = geometry._geometry.Buffer(distance)
-        geometry = Geometry(geometry_buffered.ExportToJson(), proj)
-
-        return geometry
+        geometry = self.transform(proj)
+        return Geometry._wrap(geometry._geometry.Buffer(distance))
 
     def transform(self, proj=None, maxError=None):
         """
@@ -196,19 +189,8 @@ class Geometry(ge.computedobject.ComputedObject):
         if (not isinstance(proj, ge.Projection)):
             proj = ge.Projection(proj)
 
-        geometry = self.copy()
-
-        source = osr.SpatialReference()
-        source.ImportFromWkt(geometry.projection().wkt())
-
-        target = osr.SpatialReference()
-        target.ImportFromWkt(proj.wkt())
-
-        trans = osr.CoordinateTransformation(source, target)
-
-        geometry._geometry.Transform(trans)
-
-        return geometry
+        return self.applyFunc(
+            lambda geometry: Vector.TransformGeometry(geometry, proj.wkt()))
 
     def projection(self):
         """
@@ -251,15 +233,10 @@ class Geometry(ge.computedobject.ComputedObject):
         return geometry["coordinates"]
 
     def centroid(self):
-        geometry = self.copy()
-        geometry._geometry = geometry._geometry.Centroid()
-        return geometry
+        return self.applyFunc(ogr.Geometry.Centroid)
 
     def bounds(self):
-        geometry = self.copy()
-        shape = Vector.Shape(geometry.toGeoJSON())
-        bounds = shape.GetLayer().GetExtent()
-        return bounds
+        return self._geometry.GetEnvelope()
 
     def applyAtomicFunc(self, func, other=None):
         if other:
@@ -272,9 +249,7 @@ class Geometry(ge.computedobject.ComputedObject):
         return geometry
 
     def applyFunc(self, func, other=None):
-        geometry = self.copy()
-        geometry._geometry = self.applyAtomicFunc(func, other)
-        return geometry
+        return Geometry._wrap(self.applyAtomicFunc(func, other))
 
     def toGeoJSON(self):
         return self._geometry.ExportToJson()
@@ -289,7 +264,7 @@ class Geometry(ge.computedobject.ComputedObject):
             return super(Geometry, self).encode(opt_encoder)
 
     def copy(self):
-        return Geometry(self.toGeoJSON(), self.projection())
+        return Geometry._wrap(self._geometry)
 
     @staticmethod
     def name():
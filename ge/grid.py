@@ -0,0 +1,74 @@
+#!/usr/bin/env python
+"""The pixel grid and type of bands."""
+
+import numpy as np
+
+
+class Grid(object):
+    """An immutable record of the metadata of a band.
+
+    A Grid holds the size, georeferencing, pixel type and nodata value of a
+    band. Grids are never modified, so the bands of an image, and the bands
+    computed from them, share one Grid by reference instead of copying
+    these fields into each band. replace() returns a new Grid, or the same
+    one when nothing changes.
+    """
+
+    __slots__ = ('cols', 'rows', 'crs', 'transform', 'dtype', 'nodata')
+
+    def __init__(self, cols=None, rows=None, crs=None, transform=None,
+                 dtype=None, nodata=None):
+        """Creates a grid.
+
+        Args:
+          cols: The number of columns.
+          rows: The number of rows.
+          crs: The WKT of the coordinate reference system.
+          transform: The GDAL geotransform of the pixels, as a tuple.
+          dtype: The numpy dtype of the pixels.
+          nodata: The value of pixels without data, or None.
+        """
+        initialize = object.__setattr__
+        initialize(self, 'cols', cols)
+        initialize(self, 'rows', rows)
+        initialize(self, 'crs', crs)
+        initialize(self, 'transform',
+                   tuple(transform) if transform is not None else None)
+        initialize(self, 'dtype',
+                   np.dtype(dtype) if dtype is not None else None)
+        initialize(self, 'nodata', nodata)
+
+    def replace(self, **fields):
+        """Returns a grid with some fields changed, e.g. replace(cols=10)."""
+        if all(getattr(self, name) == value or
+               getattr(self, name) is value
+               for name, value in fields.items()):
+            return self
+        values = dict((name, getattr(self, name)) for name in self.__slots__)
+        values.update(fields)
+        return Grid(**values)
+
+    def __setattr__(self, name, value):
+        raise AttributeError('Grid is immutable, use replace().')
+
+    def __delattr__(self, name):
+        raise AttributeError('Grid is immutable, use replace().')
+
+    def __reduce__(self):
+        return Grid, tuple(getattr(self, name) for name in self.__slots__)
+
+    def __eq__(self, other):
+        return (isinstance(other, Grid) and
+                all(getattr(self, name) == getattr(other, name)
+                    for name in self.__slots__))
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(tuple(getattr(self, name) for name in self.__slots__))
+
+    def __repr__(self):
+        return 'Grid({fields})'.format(fields=', '.join(
+            '{0}={1!r}'.format(name, getattr(self, name))
+            for name in self.__slots__))
@@ -1,23 +1,34 @@
+import collections
+import functools
 import gc
+import hashlib
 import random
 from urllib.parse import urlparse
 
 import numpy as np
-import tensorflow as tf
 from osgeo import gdal
 from osgeo import gdal_array
 
 import ge.apifunction
+import ge.backend
+import ge.cache
+import ge.dictionary
+import ge.dtypes
+import ge.ee_exception
 import ge.ee_list
 import ge.element
+import ge.expression
+import ge.kernel
 from ge.db import models
-from ge.tools import Raster
+from ge.grid import Grid
+from ge.tools import MemoryFiles, Raster, RasterSource, Vector
 
 
 # https://pcjericks.github.io/py-gdalogr-cookbook/
 
 class Image(ge.element.Element):
     def __init__(self, *args, **kwargs):
+        bands = kwargs.pop('bands', None)
         super(Image, self).__init__(
             ge.apifunction.ApiFunction.lookup('Image.load'), kwargs)
 
@@ -26,7 +37,7 @@ class Image(ge.element.Element):
 
         if len(args) > 0:
             if isinstance(args[0], str):
-                image = self.load(args[0])
+                image = self.load(args[0], bands)
                 self._id = image._id
                 self._bands = image._bands
                 self._properties = image._properties
@@ -37,13 +48,20 @@ class Image(ge.element.Element):
                 self._properties = image._properties
 
     @staticmethod
-    def load(id):
+    def load(id, bands=None):
+        """
+        Loads an image from the local disk or, for "db://" ids, from the
+        database.
+
+        :param bands: Optional list of band names (e.g. ['B4', 'B5']) to
+        load. Bands left out are never read.
+        """
         id = urlparse(id)
 
         if id.scheme == "db":
-            image = Image._loadFromDatabase(id.netloc + id.path)
+            image = Image._loadFromDatabase(id.netloc + id.path, bands)
         else:
-            image = Image._loadFromLocalDisk(id.path)
+            image = Image._loadFromLocalDisk(id.path, bands)
         return image
 
     @staticmethod
@@ -51,49 +69,83 @@ class Image(ge.element.Element):
         image = Image()
         image._id = "constant"
 
-        if isinstance(value, int):
-            image_type = gdal.GDT_Int16
-        elif isinstance(value, float):
-            image_type = gdal.GDT_Float32
-        else:
-            image_type = gdal.GDT_Float32
+        # The smallest type holding the value, so that constants do not
+        # widen the bands they are combined with.
+        image_type = ge.dtypes.ofConstant(value)
         band = Band(name=image._id, type=image_type,
-                    data=tf.convert_to_tensor(value))
+                    data=np.asarray(value, dtype=image_type))
         image._bands = image._bands.add(band)
         return image
 
     @staticmethod
-    def _loadFromLocalDisk(id):
+    def fromArray(array, bandNames=None, crs=None, transform=None):
+        """
+        Creates an image from a (bands, rows, cols) array. The array is not
+        copied: each band is a view of one of its planes, and toArray()
+        returns the array itself.
+
+        :param bandNames: The names of the bands, by default B1, B2, ...
+        :param crs: The WKT of the coordinate reference system.
+        :param transform: The GDAL geotransform of the pixels.
+        """
+        array = np.asarray(array)
+        if array.ndim != 3:
+            raise ValueError("Expected a (bands, rows, cols) array.")
+        if bandNames is None:
+            bandNames = ["B{band_number}".format(band_number=index)
+                         for index in range(1, array.shape[0] + 1)]
+
+        image = Image()
+        grid = Grid(cols=array.shape[2], rows=array.shape[1], crs=crs,
+                    transform=transform, dtype=array.dtype)
+        bands = [Band(name=band_name, data=data, grid=grid)
+                 for band_name, data in zip(bandNames, array)]
+        image._bands = ge.ee_list.List(bands)
+        return image
+
+    @staticmethod
+    def _loadFromLocalDisk(id, bands=None, files=None):
         image = Image()
         image._id = id
 
         dataSource = gdal.Open(id)
 
-        for index in range(1, dataSource.RasterCount + 1):
-            band_name = "B{band_number}".format(band_number=index)
-            band_data = dataSource.GetRasterBand(index).ReadAsArray()
-
-            band_type = band_data.dtype
-            if isinstance(band_type, int):
-                band_type = gdal.GDT_Int16
-            elif isinstance(band_type, float):
-                band_type = gdal.GDT_Float32
-            else:
-                band_type = gdal.GDT_Float32
-
-            band = Band(name=band_name, type=band_type, data=band_data)
-            band = band.setCols(dataSource.RasterXSize)
-            band = band.setRows(dataSource.RasterYSize)
-            band = band.setCRS(dataSource.GetProjectionRef())
-            band = band.setTransform(dataSource.GetGeoTransform())
-            print("Band {count} carregada!".format(count=index))
+        band_names = ["B{band_number}".format(band_number=index)
+                      for index in range(1, dataSource.RasterCount + 1)]
+        if bands is None:
+            bands = band_names
+        elif not isinstance(bands, list):
+            bands = [bands]
+
+        # Bands only keep a lazy handle to the dataset, pixels are read
+        # later and only for the window an operation needs. Bands of the
+        # same type and nodata value share their grid.
+        grid = Grid(cols=dataSource.RasterXSize,
+                    rows=dataSource.RasterYSize,
+                    crs=dataSource.GetProjectionRef(),
+                    transform=dataSource.GetGeoTransform())
+        grids = {}
+        for band_name in bands:
+            if band_name not in band_names:
+                raise Exception("Band {band_name} not found in image.".format(
+                    band_name=band_name))
+            index = band_names.index(band_name) + 1
+            band_source = RasterSource(dataSource, index, files)
+
+            key = (band_source.band().DataType,
+                   band_source.band().GetNoDataValue())
+            if key not in grids:
+                grids[key] = grid.replace(dtype=ge.dtypes.toNumpy(key[0]),
+                                          nodata=key[1])
+            band = Band(name=band_name, source=band_source,
+                        grid=grids[key])
 
             image._bands = image._bands.add(band)
 
         return image
 
     @staticmethod
-    def _loadFromDatabase(dataSourceNamePrefix):
+    def _loadFromDatabase(dataSourceNamePrefix, bands=None):
         print("dataSourceNamePrefix:", dataSourceNamePrefix)
         words = dataSourceNamePrefix.split("/")
 
@@ -112,10 +164,13 @@ class Image(ge.element.Element):
                                          path=filename).first()
 
             if image:
+                # The file is only copied into memory, bands are decoded
+                # lazily and only the selected ones.
                 filename = "/vsimem/{hash}".format(
                     hash=random.getrandbits(128))
+                files = MemoryFiles(filename)
                 gdal.FileFromMemBuffer(filename, image.file.read())
-                return Image._loadFromLocalDisk(filename)
+                return Image._loadFromLocalDisk(filename, bands, files)
             else:
                 raise FileNotFoundError("Image not found")
         else:
@@ -161,49 +216,113 @@ class Image(ge.element.Element):
         return names
 
     def add(self, image2):
-        return self.applyFunc(ge.Image(image2), tf.math.add)
+        return self.applyFunc(ge.Image(image2), 'add')
 
     def multiply(self, image2):
-        return self.applyFunc(ge.Image(image2), tf.math.multiply)
+        return self.applyFunc(ge.Image(image2), 'multiply')
 
     def subtract(self, image2):
-        return self.applyFunc(ge.Image(image2), tf.math.subtract)
+        return self.applyFunc(ge.Image(image2), 'subtract')
 
     def divide(self, image2):
-        return self.applyFunc(ge.Image(image2), tf.math.divide)
+        return self.applyFunc(ge.Image(image2), 'divide')
 
     def eq(self, image2):
-        return self.applyFunc(ge.Image(image2), tf.math.equal)
+        return self.applyFunc(ge.Image(image2), 'eq')
 
     def gt(self, image2):
-        return self.applyFunc(ge.Image(image2), tf.math.greater)
+        return self.applyFunc(ge.Image(image2), 'gt')
 
     def gte(self, image2):
-        return self.applyFunc(ge.Image(image2), tf.math.greater_equal)
+        return self.applyFunc(ge.Image(image2), 'gte')
 
     def lt(self, image2):
-        return self.applyFunc(ge.Image(image2), tf.math.less)
+        return self.applyFunc(ge.Image(image2), 'lt')
 
     def lte(self, image2):
-        return self.applyFunc(ge.Image(image2), tf.math.less_equal)
+        return self.applyFunc(ge.Image(image2), 'lte')
 
     def matrixMultiply(self, image2):
-        return self.applyFunc(ge.Image(image2), tf.math.matmul)
+        return self.applyFunc(ge.Image(image2), 'matrixMultiply')
 
     def max(self, image2):
-        return self.applyFunc(ge.Image(image2), tf.math.maximum)
+        return self.applyFunc(ge.Image(image2), 'max')
 
     def min(self, image2):
-        return self.applyFunc(ge.Image(image2), tf.math.minimum)
+        return self.applyFunc(ge.Image(image2), 'min')
 
     def neq(self, image2):
-        return self.applyFunc(ge.Image(image2), tf.math.not_equal)
+        return self.applyFunc(ge.Image(image2), 'neq')
+
+    def pow(self, image2):
+        return self.applyFunc(ge.Image(image2), 'pow')
+
+    def mod(self, image2):
+        return self.applyFunc(ge.Image(image2), 'mod')
+
+    def And(self, image2):
+        return self.applyFunc(ge.Image(image2), 'and')
+
+    def Or(self, image2):
+        return self.applyFunc(ge.Image(image2), 'or')
+
+    def Not(self):
+        return self.applyFuncMono('not')
 
     def exp(self):
-        return self.applyFuncMono(tf.math.exp)
+        return self.applyFuncMono('exp')
 
     def log(self):
-        return self.applyFuncMono(tf.math.log)
+        return self.applyFuncMono('log')
+
+    def abs(self):
+        return self.applyFuncMono('abs')
+
+    def sqrt(self):
+        return self.applyFuncMono('sqrt')
+
+    def floor(self):
+        return self.applyFuncMono('floor')
+
+    def ceil(self):
+        return self.applyFuncMono('ceil')
+
+    def where(self, test, value):
+        """
+        Performs conditional replacement of values: for each pixel in each
+        band, if the corresponding pixel in test is nonzero, output the
+        corresponding pixel in value, otherwise output the input pixel.
+        """
+        test = ge.Image(test)
+        value = ge.Image(value)
+        new_image = Image()
+        new_image = new_image.copyProperties(self)
+        new_image._bands = ge.ee_list.List([
+            band._invoke('where', {'test': test_band, 'value': value_band,
+                                   'input': band},
+                         like=_named(band, value_band, test_band))
+            for band, test_band, value_band in _broadcast(
+                self._bands, test._bands, value._bands)])
+        return new_image
+
+    def expression(self, expression, map=None):
+        """
+        Evaluates an arithmetic expression on the image, e.g.
+        image.expression("2.5 * (NIR - RED) / (NIR + 6 * RED - 7.5 * BLUE + 1)")
+
+        The formula is Python syntax: + - * / ** %, comparisons, and, or,
+        not, "a if test else b" and the functions abs, sqrt, exp, log,
+        floor, ceil, min, max and pow. Names refer to the images in map, or
+        else to the bands of this image (as does b('name') or b(index)).
+
+        The formula is parsed once and builds a single deferred expression,
+        so it is evaluated in one pass per tile without full size
+        intermediate bands.
+
+        :param expression: The formula.
+        :param map: Optional dictionary from names to images or numbers.
+        """
+        return ge.expression.build(expression, self, map)
 
     def rename(self, var_args=[]):
         if isinstance(var_args, str):
@@ -215,30 +334,90 @@ class Image(ge.element.Element):
                                                band.setName(band_name))
         return image
 
-    def toInt16(self):
+    def bitwiseAnd(self, image2):
+        return self.applyFunc(ge.Image(image2), 'bitwiseAnd')
+
+    def bitwiseOr(self, image2):
+        return self.applyFunc(ge.Image(image2), 'bitwiseOr')
+
+    def bitwiseXor(self, image2):
+        return self.applyFunc(ge.Image(image2), 'bitwiseXor')
+
+    def bitwiseNot(self):
+        return self.applyFuncMono('bitwiseNot')
+
+    def leftShift(self, image2):
+        return self.applyFunc(ge.Image(image2), 'leftShift')
+
+    def rightShift(self, image2):
+        return self.applyFunc(ge.Image(image2), 'rightShift')
+
+    def cast(self, type):
+        """
+        Converts the pixels of every band to a type. Values out of the range
+        of the type wrap around, as with numpy's astype.
+
+        :param type: A numpy type (e.g. numpy.uint8) or a GDAL type code
+        (e.g. gdal.GDT_Byte).
+        """
         image = self.copy()
         bands = ge.ee_list.List([])
         for band_index, band in enumerate(image._bands):
-            band = band.setType(gdal.GDT_Int16)
-            bands = bands.add(band)
+            bands = bands.add(band.cast(type))
         image._bands = bands
         return image
 
+    def toByte(self):
+        return self.cast(np.uint8)
+
+    def toUint16(self):
+        return self.cast(np.uint16)
+
+    def toInt16(self):
+        return self.cast(np.int16)
+
+    def toInt32(self):
+        return self.cast(np.int32)
+
     def int(self):
         return self.toInt16()
 
     def toFloat32(self):
-        image = self.copy()
-        bands = ge.ee_list.List([])
-        for band_index, band in enumerate(image._bands):
-            band = band.setType(gdal.GDT_Float32)
-            bands = bands.add(band)
-        image._bands = bands
-        return image
+        return self.cast(np.float32)
 
     def float(self):
         return self.toFloat32()
 
+    def toDouble(self):
+        return self.cast(np.float64)
+
+    def updateMask(self, mask):
+        """
+        Masks the pixels of the image where mask is 0 or masked, on top of
+        the pixels already masked. The pixels keep their values.
+
+        :param mask: An image with one band, or one band per band of this
+        image, or a number.
+        """
+        return self.applyFunc(ge.Image(mask), 'updateMask')
+
+    def mask(self):
+        """
+        Returns the mask of each band, as a uint8 band that is 1 where the
+        pixel is valid and 0 where it is masked.
+        """
+        return self.applyFuncMono('mask')
+
+    def unmask(self, value=0):
+        """
+        Replaces the masked pixels with value, which unmasks them unless
+        value is itself masked there.
+
+        :param value: An image with one band, or one band per band of this
+        image, or a number.
+        """
+        return self.applyFunc(ge.Image(value), 'unmask')
+
     def projection(self):
         """
         return the project of first band
@@ -248,8 +427,22 @@ class Image(ge.element.Element):
                              transform=first_band.getTransform())
         return proj
 
-    def reduce(self, image2, function):
-        pass
+    def reduce(self, reducer):
+        """
+        Reduces the bands of the image pixel by pixel, e.g. into their mean
+        or the index of their largest value (ge.Reducer.argmax()). The bands
+        are stacked into one (bands, rows, cols) block per tile and reduced
+        by one vectorized call.
+
+        :param reducer: A ge.Reducer.
+        :return: An image with one band per output of the reducer, named
+        after the output (e.g. 'mean').
+        """
+        new_image = Image()
+        new_image = new_image.copyProperties(self)
+        new_image._bands = ge.ee_list.List(
+            Band.reduceBands(list(self._bands), reducer, stacked=True))
+        return new_image
 
     def select(self, opt_selectors=[], opt_names=[]):
         opt_selectors = [opt_selectors] if not isinstance(opt_selectors,
@@ -264,6 +457,9 @@ class Image(ge.element.Element):
                     if band.getName() == selector:
                         new_band = band
                         break
+            elif isinstance(selector, int) and \
+                    -bands.length() <= selector < bands.length():
+                new_band = bands.get(selector)
 
             if new_band is None:
                 raise Exception("Band {band_name} not found in image.".format(
@@ -285,29 +481,20 @@ class Image(ge.element.Element):
         return normDifference
 
     def applyFunc(self, image2, func):
+        """
+        Returns the image computing func(band, band2) for the pairs of bands
+        of this image and image2 given by the broadcasting rules (see
+        _broadcast()).
+        """
         new_image = Image()
         new_image = new_image.copyProperties(self)
-
-        if self._bands.length() == image2._bands.length():
-            for index, band in enumerate(self._bands):
-                band2 = image2._bands.get(index)
-                new_band = band.applyFunc(band2, func)
-                new_image._bands = new_image._bands.add(new_band)
-
-        elif self._bands.length() > 1 and image2._bands.length() == 1:
-            for band in self._bands:
-                for band2 in image2._bands:
-                    new_band = band.applyFunc(band2, func)
-                    new_image._bands = new_image._bands.add(new_band)
-
-        elif self._bands.length() == 1 or image2._bands.length() > 1:
-            for band2 in image2._bands:
-                for band in self._bands:
-                    new_band = band.applyFunc(band2, func)
-                    new_image._bands = new_image._bands.add(new_band)
-        else:
-            raise IndexError("Band index error")
-
+        pairs = _broadcast(self._bands, image2._bands)
+        bands = [band.applyFunc(band2, func) for band, band2 in pairs]
+        if self._bands.length() < image2._bands.length():
+            # A single band applied to every band of image2 takes its names.
+            bands = [new_band.setName(band2.getName())
+                     for new_band, (_, band2) in zip(bands, pairs)]
+        new_image._bands = ge.ee_list.List(bands)
         return new_image
 
     def applyFuncMono(self, func):
@@ -320,38 +507,127 @@ class Image(ge.element.Element):
 
         return new_image
 
-    def reproject(self, crs=None, crsTransform=None, scale=None):
+    def reproject(self, crs=None, crsTransform=None, scale=None,
+                  resampling='near', warpMemoryLimit=None):
+        """
+        Reprojects the image. The bands are warped together, with one
+        multi-threaded GDAL call per grid and type, and bands read from
+        files are only warped where they are read later (e.g. within a
+        clip()), see Band.reprojectBands().
+
+        :param crs: The target CRS, as WKT, an authority code or a
+        ge.Projection. Defaults to the CRS of the image.
+        :param crsTransform: Optional GDAL geotransform whose pixel size and
+        alignment the result takes.
+        :param scale: Optional pixel size in units of crs.
+        :param resampling: The GDAL resampling method, e.g. 'near',
+        'bilinear', 'cubic' or 'average'.
+        :param warpMemoryLimit: The memory of the warper in bytes, see
+        ge.tools.raster.WARP_MEMORY_LIMIT.
+        """
         if not crs:
             crs = self.projection().crs()
+        if isinstance(crs, ge.Projection):
+            crs = crs.wkt()
         if crsTransform and scale:
             raise ValueError("crsTransform and scale cannot both be value.")
 
-        image = self.copy().getInfo()
-        bands = ge.ee_list.List([])
-        for band_index, band in enumerate(image._bands):
-            band_reprojected = band.reproject(crs, crsTransform, scale)
-            bands = bands.add(band_reprojected)
-        image._bands = bands
+        image = self.copy()
+        image._bands = ge.ee_list.List(Band.reprojectBands(
+            list(image._bands), crs, crsTransform, scale, resampling,
+            warpMemoryLimit))
         return image
 
     def clip(self, geometry):
-        image = self.copy().getInfo()
-        bands = ge.ee_list.List([])
-        for band_index, band in enumerate(image._bands):
-            band_clipped = band.clip(geometry)
-            bands = bands.add(band_clipped)
-        image._bands = bands
+        """
+        Clips the image to a geometry: the bands are restricted to the
+        window covering the geometry and the pixels outside it are masked,
+        see Band.clipBands(). Only that window is ever read.
+        """
+        image = self.copy()
+        image._bands = ge.ee_list.List(
+            Band.clipBands(list(image._bands), geometry))
         return image
 
+    def reduceRegion(self, reducer, geometry=None, scale=None):
+        """
+        Reduces the pixels of each band inside a geometry (zonal
+        statistics), e.g. the mean NDVI of a field. Masked pixels are left
+        out. Only the window covering the geometry is read, and the mask of
+        the geometry is cached (see RASTERIZED_MASKS), so reducing the
+        images of a time series over the same fields rasterizes each field
+        once.
+
+        :param reducer: A ge.Reducer.
+        :param geometry: A ge.Geometry, by default the whole image.
+        :param scale: Unused, pixels are reduced at the resolution of the
+        bands.
+        :return: A ge.Dictionary from the band names (<band>_<output> for
+        reducers with several outputs) to the values, None if no pixel is
+        valid.
+        """
+        bands = list(self._bands)
+        if geometry is not None:
+            bands = Band.clipBands(bands, geometry)
+
+        backend = ge.backend.current()
+        outputs = reducer.outputs()
+        values = {}
+        results = ge.kernel.Kernel(bands).evaluate()
+        for band, (data, mask) in zip(bands, results):
+            dtype, output_types = reducer.types(band.getDataType())
+            pixels = np.asarray(backend.numpy(data))
+            if mask is not None:
+                mask = np.broadcast_to(backend.numpy(mask), pixels.shape)
+                pixels = pixels[mask]
+            pixels = pixels.ravel().astype(dtype, copy=False)
+            if pixels.size:
+                band_values, _ = reducer.reduce(np, pixels)
+            else:
+                band_values = [0 if reducer.getName() == 'count' else None
+                               for _ in outputs]
+            for output, output_type, value in zip(outputs, output_types,
+                                                  band_values):
+                name = band.getName()
+                if len(outputs) > 1:
+                    name = '{band}_{output}'.format(band=name, output=output)
+                if value is not None:
+                    value = output_type.type(value).item()
+                values[name] = value
+        return ge.dictionary.Dictionary(values)
+
     def getInfo(self):
         image = self.copy()
         bands = ge.ee_list.List([])
-        for band_index, band in enumerate(image._bands):
-            band = band.getInfo()
+        # The bands are evaluated together, so nodes they share run once.
+        results = ge.kernel.Kernel(list(image._bands)).evaluate()
+        for band, (data, mask) in zip(image._bands, results):
+            band = band.setData(data, mask).getInfo()
             bands = bands.add(band)
         image._bands = bands
         return image
 
+    def toArray(self):
+        """
+        Returns the pixels of every band as one (bands, rows, cols) numpy
+        array.
+
+        Bands that are consecutive planes of one array (from fromArray(), or
+        read from the same file by getInfo()) are returned as that array,
+        without copying them.
+        """
+        datas = [np.asarray(band.getData())
+                 for band in self.getInfo()._bands]
+        stacked = _planesOf(datas)
+        if stacked is not None:
+            return stacked
+        # np.broadcast takes at most 32 arrays, so the bands are folded in
+        # one at a time (np.broadcast_shapes needs numpy 1.20).
+        shape = functools.reduce(
+            lambda shape, data: np.broadcast(np.broadcast_to(0, shape),
+                                             data).shape, datas, ())
+        return np.stack([np.broadcast_to(data, shape) for data in datas])
+
     def copy(self):
         return Image(self.args, **self.__dict__)
 
@@ -363,154 +639,656 @@ class Image(ge.element.Element):
         return 'Image'
 
 
+_EMPTY_GRID = Grid()
+
+# The total size of the masks kept by RASTERIZED_MASKS.
+MAX_RASTERIZED_MASK_BYTES = 256 * 1024 * 1024
+
+# The masks of the geometries clipped to or reduced over, keyed by
+# geometry and pixel grid, so that clipping the images of a time series to
+# the same fields rasterizes each field once. See stats() for its hits and
+# misses.
+RASTERIZED_MASKS = ge.cache.LRUCache(
+    maxsize=4096, maxbytes=MAX_RASTERIZED_MASK_BYTES,
+    sizeof=lambda entry: entry[1].nbytes)
+
+
+def _rasterize(geometry, grid, all_touched=False):
+    """
+    Returns the window of a grid covering a geometry, and the read-only
+    mask of the pixels of that window inside the geometry.
+    """
+    ogr_geometry = geometry._geometry
+    srs = ogr_geometry.GetSpatialReference()
+    key = (hashlib.sha1(bytes(ogr_geometry.ExportToWkb())).hexdigest(),
+           srs.ExportToWkt() if srs is not None else None,
+           grid.crs, grid.transform, (grid.cols, grid.rows), all_touched)
+    entry = RASTERIZED_MASKS.get(key)
+    if entry is None:
+        ogr_geometry = Vector.TransformGeometry(ogr_geometry, grid.crs)
+        window = Raster.GeometryWindow(ogr_geometry, grid.transform,
+                                       grid.cols, grid.rows)
+        transform = Raster.WindowTransform(grid.transform, window[0],
+                                           window[1])
+        mask = Raster.RasterizeGeometry(ogr_geometry, transform, window[2],
+                                        window[3], all_touched)
+        mask.flags.writeable = False
+        entry = window, mask
+        RASTERIZED_MASKS.put(key, entry)
+    return entry
+
+
+def _named(*bands):
+    """
+    Returns the first band that is on a grid and not a constant, the one
+    the result of an operation on the bands is named after, or the first
+    band if there is none.
+    """
+    return next((band for band in bands
+                 if band.getCols() is not None and not band.isConstant()),
+                bands[0])
+
+
+def _broadcast(*images_bands):
+    """
+    Returns the tuples of bands an operation on several images applies to.
+
+    Images with the same number of bands are matched band by band, and an
+    image with a single band (e.g. a constant or a mask) is matched with
+    every band of the others. Pixels are broadcast by the backend when the
+    operation runs: a constant is a 0-d array combined with each tile as
+    is, never expanded to the size of the bands.
+
+    :param images_bands: The list of bands of each image.
+    """
+    images_bands = [list(bands) for bands in images_bands]
+    count = max(len(bands) for bands in images_bands)
+    for bands in images_bands:
+        if len(bands) not in (1, count):
+            raise ge.ee_exception.EEException(
+                "Images must have one band or the same number of bands, "
+                "got {counts}.".format(
+                    counts=[len(bands) for bands in images_bands]))
+    return list(zip(*[bands * count if len(bands) == 1 else bands
+                      for bands in images_bands]))
+
+
+def _readTogether(bands):
+    """
+    Returns whether bands are read from the same window of one file.
+    """
+    sources = [band.getSource() for band in bands]
+    return (all(band._data is None and band._mask is None and
+                source is not None for band, source in zip(bands, sources))
+            and len(set((source.datasetKey(), band.getWindow())
+                        for band, source in zip(bands, sources))) == 1)
+
+
+def _warpedGrid(band, warped, number):
+    return band.getGrid().replace(
+        cols=warped.RasterXSize, rows=warped.RasterYSize,
+        crs=warped.GetProjectionRef(), transform=warped.GetGeoTransform(),
+        nodata=warped.GetRasterBand(number).GetNoDataValue())
+
+
+def _warpLazily(bands, crs, crsTransform, scale, resampling,
+                warpMemoryLimit):
+    """
+    Returns bands read from one file (see _readTogether()) as bands of a
+    warped VRT over it. Both VRTs are written to /vsimem, so the bands can
+    be read by every thread, and unlinked once the bands are released.
+    """
+    path = '/vsimem/ge/warp/{hash}'.format(hash=random.getrandbits(128))
+    files = MemoryFiles(path + '.source.vrt', path + '.vrt')
+    dataset = RasterSource.viewBands(
+        [band.getSource() for band in bands], bands[0].getWindow(),
+        path + '.source.vrt')
+    for number, band in enumerate(bands, 1):
+        if band.getNoData() is not None:
+            dataset.GetRasterBand(number).SetNoDataValue(band.getNoData())
+    dataset.FlushCache()
+
+    warped = Raster.Warp(dataset, crs, crsTransform, scale, resampling,
+                         warpMemoryLimit, format='VRT',
+                         destination=path + '.vrt')
+    warped.FlushCache()
+    warped_bands = []
+    for number, band in enumerate(bands, 1):
+        warped_band = Band(name=band.getName(),
+                           source=RasterSource(warped, number, files),
+                           grid=_warpedGrid(band, warped, number))
+        warped_band._properties = band._properties
+        warped_bands.append(warped_band)
+    return warped_bands
+
+
+def _warp(bands, crs, crsTransform, scale, resampling, warpMemoryLimit):
+    """
+    Returns bands on the same grid and of the same type computed and
+    warped into memory. The mask band of the warped dataset holds the
+    pixels valid in every band.
+    """
+    first = bands[0]
+    backend = ge.backend.current()
+    array = np.empty((len(bands), first.getRows(), first.getCols()),
+                     dtype=ge.dtypes.storage(first.getDataType()))
+    valid = None
+    for plane, (data, mask) in zip(
+            array, ge.kernel.Kernel(bands).evaluate()):
+        plane[...] = backend.numpy(data)
+        if mask is not None:
+            mask = np.broadcast_to(backend.numpy(mask), plane.shape)
+            valid = mask.copy() if valid is None else valid & mask
+
+    dataset = gdal_array.OpenArray(array)
+    dataset.SetGeoTransform(first.getTransform())
+    dataset.SetProjection(first.getCRS())
+    if valid is not None:
+        dataset.CreateMaskBand(gdal.GMF_PER_DATASET)
+        dataset.GetRasterBand(1).GetMaskBand().WriteArray(
+            valid.astype(np.uint8) * 255)
+
+    warped = Raster.Warp(dataset, crs, crsTransform, scale, resampling,
+                         warpMemoryLimit)
+    warped_array = warped.ReadAsArray().reshape(
+        warped.RasterCount, warped.RasterYSize, warped.RasterXSize)
+    # An alpha band follows the bands if they were masked.
+    mask = warped_array[-1] != 0 if warped.RasterCount > len(bands) \
+        else None
+    return [band.setGrid(_warpedGrid(band, warped, number)).setData(
+                warped_array[number - 1].astype(band.getDataType(),
+                                                copy=False), mask)
+            for number, band in enumerate(bands, 1)]
+
+
+def _planesOf(arrays):
+    """
+    Returns the 3-D view the arrays are the consecutive planes of, or None.
+    """
+    first = arrays[0]
+    base = first.base
+    if base is None or first.ndim != 2:
+        return None
+    start = first.__array_interface__['data'][0]
+    plane = (arrays[1].__array_interface__['data'][0] - start
+             if len(arrays) > 1 else first.nbytes)
+    for index, array in enumerate(arrays):
+        if (array.base is not base or array.dtype != first.dtype or
+                array.shape != first.shape or
+                array.strides != first.strides or
+                array.__array_interface__['data'][0] != start + index * plane):
+            return None
+    return np.lib.stride_tricks.as_strided(
+        first, shape=(len(arrays),) + first.shape,
+        strides=(plane,) + first.strides, writeable=False)
+
+
 class Band(ge.element.Element):
-    def __init__(self, name, type, data=None, **kwargs):
+    def __init__(self, name, type=None, data=None, source=None, grid=None,
+                 mask=None, **kwargs):
+        """
+        :param type: The type of the pixels, a numpy type or a GDAL type
+        code. If None, the type of the grid, of data or of the source band.
+        :param data: The pixels of the band, if they are already in memory.
+        :param source: A RasterSource the pixels are lazily read from, used
+        when data is None.
+        :param grid: The ge.Grid of the band, shared with the bands on the
+        same grid. By default an empty grid.
+        :param mask: The validity of the pixels of data, a bool array False
+        at the masked pixels, or None (see getMask()).
+        """
         super(Band, self).__init__(
             ge.apifunction.ApiFunction.lookup('Image.band'), kwargs)
         self._name = name
-        self._cols = None
-        self._rows = None
-        self._crs = None
-        self._transform = None
-        self._type = type
+        if grid is None:
+            grid = _EMPTY_GRID
+        if type is None:
+            type = grid.dtype
+        if type is None and data is not None:
+            type = np.asarray(data).dtype
+        elif type is None and source is not None:
+            type = source.band().DataType
+        self._grid = grid.replace(dtype=ge.dtypes.toNumpy(type))
         self._data = data
+        self._mask = mask
+        self._source = source
+        self._window = None
         self.__dict__.update(kwargs)
 
     def getName(self):
         return self._name
 
+    def getGrid(self):
+        return self._grid
+
     def getCols(self):
-        return self._cols
+        return self._grid.cols
 
     def getRows(self):
-        return self._rows
+        return self._grid.rows
 
     def getCRS(self):
-        return self._crs
+        return self._grid.crs
 
     def getTransform(self):
-        return self._transform
+        return self._grid.transform
+
+    def getNoData(self):
+        return self._grid.nodata
 
     def getType(self):
-        return self._type
+        """
+        Returns the GDAL type code the pixels are stored as.
+        """
+        if self._grid.dtype is None:
+            return None
+        return ge.dtypes.toGdal(self._grid.dtype)
+
+    def getDataType(self):
+        """
+        Returns the numpy dtype of the pixels.
+        """
+        return self._grid.dtype
+
+    def getData(self, window=None):
+        """
+        Returns the pixels of the band, computing them if the band is a
+        deferred operation.
+
+        :param window: (xoff, yoff, xsize, ysize) in pixels of the band. If
+        unspecified, the whole band is returned.
+        """
+        if self.isComputed():
+            return ge.kernel.Kernel([self])(window)[0]
+
+        if self._data is None and self._source is not None:
+            return self._source.read(self.getWindow(window))
 
-    def getData(self):
-        return self._data
+        if window is None or len(np.shape(self._data)) < 2:
+            return self._data
+        xoff, yoff, xsize, ysize = window
+        return self._data[yoff:yoff + ysize, xoff:xoff + xsize]
+
+    def getMask(self, window=None, data=None):
+        """
+        Returns the validity of the pixels of the band, as a bool array
+        False at the masked pixels, or None if every pixel is valid.
+
+        Pixels equal to the nodata value are masked, as well as those masked
+        by the GDAL mask band of the source or by the mask of the data. The
+        mask of a deferred operation combines the masks of its operands.
+
+        :param window: (xoff, yoff, xsize, ysize) in pixels of the band. If
+        unspecified, the mask of the whole band is returned.
+        :param data: The pixels of the window, if they are already read.
+        """
+        if self.isComputed():
+            return ge.kernel.Kernel([self]).evaluate(window)[0][1]
+
+        masks = []
+        nodata = self._grid.nodata
+        if nodata is not None:
+            if data is None:
+                data = self.getData(window)
+            data = np.asarray(data)
+            # NaN is the only value not equal to itself.
+            masks.append(data == data if nodata != nodata
+                         else data != nodata)
+        if self._mask is not None:
+            mask = self._mask
+            if window is not None and len(np.shape(mask)) >= 2:
+                xoff, yoff, xsize, ysize = window
+                mask = mask[yoff:yoff + ysize, xoff:xoff + xsize]
+            masks.append(mask)
+        if (self._data is None and self._source is not None and
+                self._source.hasMask()):
+            masks.append(self._source.readMask(self.getWindow(window)))
+
+        if not masks:
+            return None
+        return functools.reduce(np.logical_and, masks)
+
+    def hasMask(self):
+        """
+        Returns whether the band may have masked pixels, without reading or
+        computing them.
+        """
+        if self.isComputed():
+            return ge.kernel.Kernel([self]).maskable()[0]
+        return (self._grid.nodata is not None or self._mask is not None or
+                (self._data is None and self._source is not None and
+                 self._source.hasMask()))
+
+    def getSource(self):
+        return self._source
+
+    def getWindow(self, window=None):
+        """
+        Returns the (xoff, yoff, xsize, ysize) window of the source read by
+        this band.
+
+        :param window: A window in pixels of the band, whose window in the
+        source is returned instead.
+        """
+        if self._window is not None:
+            band_window = self._window
+        else:
+            band_window = (0, 0, self.getCols(), self.getRows())
+        if window is None:
+            return band_window
+        xoff, yoff, _, _ = band_window
+        return (xoff + window[0], yoff + window[1], window[2], window[3])
 
     def setName(self, name):
         band = self.copy()
         band._name = name
         return band
 
-    def setCols(self, cols):
+    def setGrid(self, grid):
         band = self.copy()
-        band._cols = cols
+        band._grid = grid
         return band
 
+    def setCols(self, cols):
+        return self.setGrid(self._grid.replace(cols=cols))
+
     def setRows(self, rows):
-        band = self.copy()
-        band._rows = rows
-        return band
+        return self.setGrid(self._grid.replace(rows=rows))
 
     def setCRS(self, crs):
-        band = self.copy()
-        band._crs = crs
-        return band
+        return self.setGrid(self._grid.replace(crs=crs))
 
     def setTransform(self, transform):
-        band = self.copy()
-        band._transform = transform
-        return band
+        return self.setGrid(self._grid.replace(transform=transform))
+
+    def setNoData(self, nodata):
+        """
+        Sets the nodata value of the band. The pixels of a read band equal
+        to it are masked; for other bands it is the value masked pixels are
+        written as on export.
+        """
+        return self.setGrid(self._grid.replace(nodata=nodata))
 
     def setType(self, type):
-        band = self.copy()
-        band._type = type
-        return band
+        """
+        Sets the type of the band, without converting the pixels (see
+        cast()).
+        """
+        return self.setGrid(
+            self._grid.replace(dtype=ge.dtypes.toNumpy(type)))
 
-    def setData(self, data):
+    def setData(self, data, mask=None):
+        """
+        :param mask: The validity of the pixels, a bool array False at the
+        masked pixels, or None.
+        """
         band = self.copy()
         band._data = data
+        band._mask = mask
+        if isinstance(data, np.ndarray):
+            band._grid = band._grid.replace(dtype=data.dtype)
+        band._source = None
+        band._window = None
+        # Once materialized the band no longer depends on its operands.
+        band.args = {}
         return band
 
-    @property
-    def _gdal_dataset(self):
-        transform = self.getTransform()
-        projection = self.getCRS()
+    def setWindow(self, xoff, yoff, xsize, ysize):
+        """
+        Restricts the band to a window of its current grid. No pixel is
+        read: a read band only reads that window of its source later, and a
+        deferred operation is applied to that window of its operands.
+        """
+        return self._windowed((xoff, yoff, xsize, ysize), {})
 
-        dataset = gdal_array.OpenArray(self.getData())
-        dataset.SetGeoTransform(transform)
-        dataset.SetProjection(projection)
-        return dataset
+    def _windowed(self, window, memo):
+        # memo maps the operands already restricted to the window, so that
+        # the operands shared in the graph stay shared.
+        key = (id(self), window)
+        if key in memo:
+            return memo[key]
+        xoff, yoff, xsize, ysize = window
+
+        band = self.copy()
+        if self.isComputed():
+            band.args = dict(
+                (name, arg._windowed(window, memo)
+                 if isinstance(arg, Band) and arg.getCols() is not None
+                 else arg)
+                for name, arg in self.args.items())
+        else:
+            band._window = band.getWindow(window)
+            if band._data is not None:
+                band._data = self.getData(window)
+            if band._mask is not None and len(np.shape(band._mask)) >= 2:
+                band._mask = band._mask[yoff:yoff + ysize,
+                                        xoff:xoff + xsize]
+        transform = band.getTransform()
+        if transform:
+            transform = Raster.WindowTransform(transform, xoff, yoff)
+        band._grid = band._grid.replace(cols=xsize, rows=ysize,
+                                        transform=transform)
+        memo[key] = band
+        return band
 
     def applyFunc(self, band2, func):
-        a = tf.cast(self.getData(), tf.float32)
-        b = tf.cast(band2.getData(), tf.float32)
-        c = func(a, b)
-        new_band = Band(name=self.getName(), type=self.getType(), data=c) \
-            .setCols(self.getCols()) \
-            .setRows(self.getRows()) \
-            .setCRS(self.getCRS()) \
-            .setTransform(self.getTransform())
-        new_band = new_band.copyProperties(self)
-        return new_band
+        """
+        Returns a band computing func(self, band2). Nothing is evaluated
+        here, the operation is recorded in the func/args of the new band.
+
+        :param func: The name of the operation, run by the backend of the
+        process (see ge.backend).
+        """
+        return self._invoke(func, {'band1': self, 'band2': band2})
 
     def applyFuncMono(self, func):
-        a = tf.cast(self.getData(), tf.float32)
-        c = func(a)
-
-        new_band = Band(name=self.getName(), type=self.getType(), data=c) \
-            .setCols(self.getCols()) \
-            .setRows(self.getRows()) \
-            .setCRS(self.getCRS()) \
-            .setTransform(self.getTransform())
-        new_band = new_band.copyProperties(self)
+        return self._invoke(func, {'band1': self})
+
+    @staticmethod
+    def reduceBands(bands, reducer, stacked=False):
+        """
+        Returns the outputs of a reducer applied pixel by pixel to bands on
+        the same grid. Nothing is evaluated here: the bands are reduced tile
+        by tile when the outputs are computed.
+
+        :param bands: The bands to reduce.
+        :param reducer: A ge.Reducer.
+        :param stacked: Whether the bands are stacked and reduced at once
+        even if the reducer can stream them one at a time (see
+        ge.Reducer), which is faster for the few bands of one image.
+        :return: One band per output of the reducer, named after the output.
+        """
+        first = bands[0]
+        dtype, output_types = reducer.types(
+            ge.dtypes.union([band.getDataType() for band in bands]))
+
+        args = {'reducer': reducer, 'stacked': stacked}
+        for index, band in enumerate(bands):
+            args['band{number}'.format(number=index + 1)] = band
+        reduction = first._invoke('reduce', args, dtype)
+
+        outputs = []
+        for index, (name, output_type) in enumerate(
+                zip(reducer.outputs(), output_types)):
+            output = reduction._invoke(
+                'item', {'input': reduction, 'index': index}, output_type)
+            outputs.append(output.setName(name))
+        return outputs
+
+    def cast(self, type):
+        """
+        Returns a band converting the pixels to a type.
+        """
+        return self._invoke('cast', {'band1': self},
+                            ge.dtypes.toNumpy(type))
+
+    def _invoke(self, func, args, type=None, like=None):
+        """
+        :param type: The type of the result, by default the one given by
+        the promotion rules of the operation (see ge.dtypes).
+        :param like: The band the result takes its name and properties
+        from, by default the one it takes its grid from.
+        """
+        if type is None:
+            _, type = ge.dtypes.promote(
+                func, [arg.getDataType() for arg in args.values()],
+                [arg.getConstant() for arg in args.values()])
+        # The result takes the grid of the first operand that has a grid, so
+        # that constant.subtract(band) is on the grid of band.
+        gridded = next((arg for arg in args.values()
+                        if isinstance(arg, Band) and
+                        arg.getCols() is not None), self)
+        if like is None:
+            like = gridded
+        # Computed pixels are masked by the masks of their operands, not by
+        # a nodata value.
+        new_band = Band(name=like.getName(), grid=gridded._grid.replace(
+            dtype=ge.dtypes.toNumpy(type), nodata=None))
+        new_band._properties = like._properties
+        new_band.func = func
+        new_band.args = args
         return new_band
 
-    def reproject(self, crs, crsTransform=None, scale=None):
-        dataset = self._gdal_dataset
+    def isConstant(self):
+        """
+        Returns whether the band is a constant, with 0-d data.
+        """
+        return self._data is not None and np.ndim(self._data) == 0
 
-        dataset_reprojected = Raster.Reproject(dataset, crs, crsTransform,
-                                               scale)
-        data = dataset_reprojected.ReadAsArray()
+    def getConstant(self):
+        """
+        Returns the value of a constant band, None for other bands.
+        """
+        if not self.isConstant():
+            return None
+        return np.asarray(self._data).item()
 
-        band = self.copy()
-        band = band \
-            .setCols(dataset_reprojected.RasterXSize) \
-            .setRows(dataset_reprojected.RasterYSize) \
-            .setCRS(dataset_reprojected.GetProjectionRef()) \
-            .setTransform(dataset_reprojected.GetGeoTransform()) \
-            .setData(data)
+    def isComputed(self):
+        """
+        Returns whether the band is a deferred operation on other bands.
+        """
+        return (self._data is None and self._source is None and
+                isinstance(self.func, str))
 
-        return band
+    def reproject(self, crs, crsTransform=None, scale=None,
+                  resampling='near', warpMemoryLimit=None):
+        return Band.reprojectBands([self], crs, crsTransform, scale,
+                                   resampling, warpMemoryLimit)[0]
+
+    @staticmethod
+    def reprojectBands(bands, crs, crsTransform=None, scale=None,
+                       resampling='near', warpMemoryLimit=None):
+        """
+        Returns bands reprojected to a CRS. The bands on the same grid and
+        of the same type are warped together (see Raster.Warp()), with one
+        multi-threaded GDAL call, and keep their type.
+
+        Bands read from one file are reprojected lazily: they become bands
+        of a warped VRT, which only resamples the blocks that are read. A
+        later clip(), reduction or export then only warps the pixels it
+        needs. Other bands are computed and warped at once, their masks
+        combined into one mask for the group.
+
+        :param bands: The bands to reproject.
+        :param crs: The target CRS, as WKT or an authority code.
+        :param crsTransform: Optional GDAL geotransform whose pixel size and
+        alignment the result takes.
+        :param scale: Optional pixel size in units of crs.
+        :param resampling: The GDAL resampling method.
+        :param warpMemoryLimit: The memory of the warper in bytes.
+        """
+        groups = collections.OrderedDict()
+        for index, band in enumerate(bands):
+            grid = band.getGrid()
+            if grid.cols is None:
+                # A constant, which has no pixel grid.
+                continue
+            key = (grid.crs, grid.transform, grid.cols, grid.rows,
+                   grid.dtype)
+            groups.setdefault(key, []).append(index)
+
+        reprojected = list(bands)
+        for indices in groups.values():
+            group = [bands[index] for index in indices]
+            if _readTogether(group):
+                bands_of_group = _warpLazily(group, crs, crsTransform,
+                                             scale, resampling,
+                                             warpMemoryLimit)
+            else:
+                bands_of_group = _warp(group, crs, crsTransform, scale,
+                                       resampling, warpMemoryLimit)
+            for index, band in zip(indices, bands_of_group):
+                reprojected[index] = band
+        return reprojected
 
     def clip(self, geometry):
-        dataset = self._gdal_dataset
-        clipped_dataset = Raster.ClipByGeometry(dataset, geometry.toGeoJSON())
-        data = clipped_dataset.ReadAsArray()
+        return Band.clipBands([self], geometry)[0]
 
-        band = self.copy()
-        band = band \
-            .setCols(clipped_dataset.RasterXSize) \
-            .setRows(clipped_dataset.RasterYSize) \
-            .setCRS(clipped_dataset.GetProjectionRef()) \
-            .setTransform(clipped_dataset.GetGeoTransform()) \
-            .setData(data)
-        return band
+    @staticmethod
+    def clipBands(bands, geometry, all_touched=False):
+        """
+        Returns bands clipped to a geometry. Nothing is read here: each band
+        is restricted to the window of its grid covering the envelope of the
+        geometry (see setWindow()), and its pixels outside the geometry are
+        masked. The geometry is rasterized once per grid, into a mask shared
+        by the bands on it and cached (see RASTERIZED_MASKS), and the pixels
+        keep their type.
+
+        :param bands: The bands to clip.
+        :param geometry: A ge.Geometry, in EPSG:4326 if it has no
+        projection.
+        :param all_touched: Whether every pixel touched by the geometry is
+        kept, instead of those whose center is inside it.
+        """
+        masks = {}
+        memo = {}
+        clipped = []
+        for band in bands:
+            grid = band.getGrid()
+            if grid.cols is None:
+                # A constant, which has no pixel grid.
+                clipped.append(band)
+                continue
+
+            key = (grid.crs, grid.transform, grid.cols, grid.rows)
+            if key not in masks:
+                window, mask = _rasterize(geometry, grid, all_touched)
+                masks[key] = window, Band(
+                    name='clip', type=np.bool_, data=mask,
+                    grid=grid.replace(
+                        cols=window[2], rows=window[3],
+                        transform=Raster.WindowTransform(
+                            grid.transform, window[0], window[1]),
+                        nodata=None))
+            window, mask = masks[key]
+
+            band = band._windowed(window, memo)
+            clipped.append(band._invoke('updateMask',
+                                        {'band1': band, 'band2': mask}))
+        return clipped
 
     def getInfo(self):
         band = self.copy()
-        data = band.getData()
-        if type(data) is np.ndarray:
-            data = data
+        backend = ge.backend.current()
+        if band.isComputed():
+            data, mask = ge.kernel.Kernel([band]).evaluate()[0]
         else:
-            data = data.numpy()
-        band = band.setData(data)
-        del data
+            data = band.getData()
+            mask = band.getMask(data=data)
+        data = backend.numpy(data)
+        if mask is not None:
+            mask = backend.numpy(mask)
+        band = band.setData(data, mask)
+        del data, mask
         gc.collect()
         return band
 
     def copy(self):
-        return Band(self._name, self._type, self._data, **self.__dict__)
+        # A shallow copy, without running __init__: the fields are either
+        # immutable (the grid) or replaced rather than modified.
+        band = Band.__new__(Band)
+        band.__dict__.update(self.__dict__)
+        return band
 
     @staticmethod
     def name():
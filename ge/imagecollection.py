@@ -1,34 +1,82 @@
-import functools
-
+import ge.ee_exception
+import ge.ee_list
+import ge.reducer
 from ge.collection import Collection
+from ge.image import Band, Image
 
 
 class ImageCollection(Collection):
     def __init__(self, features, *args, **kwargs):
-        super(ImageCollection, self).__init__(features, args, kwargs)
+        super(ImageCollection, self).__init__(features, *args, **kwargs)
 
     @staticmethod
     def load(id, version):
         pass
 
     def reduce(self, reducer, parallelScale=None):
-        from ge.image import Image, Band
-        first_image = self.first()
-        new_image = Image()
-        new_image = first_image.copyProperties(new_image)
-        for band_index, band in enumerate(first_image.getBands()):
-            band_data = []
+        """
+        Reduces the collection pixel by pixel, band i of the result reducing
+        band i of every image, in one of the two modes of ge.Reducer:
+        - Streaming, for the reducers with an online algorithm (sum, min,
+          max, count, mean, variance, stdDev, and percentiles given
+          maxBuckets, see ge.Reducer.streaming()): the images are read one
+          at a time and folded into a fixed size state per pixel, so a tile
+          of one image is held at a time whatever the size of the
+          collection.
+        - Stacked, for the other reducers (e.g. exact median or
+          percentiles): a tile of every image is stacked along a time axis
+          and reduced with one vectorized call, which holds the whole stack.
+        Masked pixels are left out, and pixels masked in every image are
+        masked in the result.
+
+        :param reducer: A ge.Reducer, e.g. ge.Reducer.median().
+        :param parallelScale: Unused, kept for compatibility with Earth
+        Engine.
+        :return: An image with one band per band of the first image and
+        output of the reducer, named <band>_<output> (e.g. B4_median).
+        """
+        return self._reduce(reducer, suffix=True)
 
-            for image in self.toList(5000):
-                image_band = image.getBands().get(band_index)
-                band_data.append(image_band.getData())
+    def _reduce(self, reducer, suffix):
+        images = list(self._features)
+        if not images:
+            raise ge.ee_exception.EEException(
+                "Cannot reduce an empty image collection.")
+        first_image = images[0]
 
-            band_data = functools.reduce(lambda x, y: reducer(x, y), band_data)
-            new_band = Band(name=band.getName(), type=band.getType(),
-                            data=band_data)
-            new_image = new_image.addBand(new_band)
+        bands = []
+        for band_index, band in enumerate(first_image.getBands()):
+            inputs = [image.getBands().get(band_index) for image in images]
+            for output in Band.reduceBands(inputs, reducer):
+                name = band.getName()
+                if suffix:
+                    name = '{band}_{output}'.format(band=name,
+                                                    output=output.getName())
+                bands.append(output.setName(name))
+
+        new_image = Image()
+        new_image = new_image.copyProperties(first_image)
+        new_image._bands = ge.ee_list.List(bands)
         return new_image
 
+    def sum(self):
+        return self._reduce(ge.reducer.Reducer.sum(), suffix=False)
+
+    def min(self):
+        return self._reduce(ge.reducer.Reducer.min(), suffix=False)
+
+    def max(self):
+        return self._reduce(ge.reducer.Reducer.max(), suffix=False)
+
+    def mean(self):
+        return self._reduce(ge.reducer.Reducer.mean(), suffix=False)
+
+    def median(self):
+        return self._reduce(ge.reducer.Reducer.median(), suffix=False)
+
+    def count(self):
+        return self._reduce(ge.reducer.Reducer.count(), suffix=False)
+
     @staticmethod
     def name():
         return 'ImageCollection'
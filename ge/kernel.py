@@ -0,0 +1,404 @@
+#!/usr/bin/env python
+"""Evaluation of deferred band expressions."""
+
+import numpy as np
+
+import ge.backend
+import ge.dtypes
+from ge.tools import RasterSource
+
+
+class Program(object):
+    """The evaluation steps of a kernel, without the bands it reads.
+
+    Two kernels computing the same expression on different bands share an
+    equal program, which is what compiled backends cache their functions by.
+    """
+
+    def __init__(self, steps, outputs, registers):
+        """Creates a program.
+
+        Args:
+          steps: The steps in evaluation order. Each step is one of
+              ('load', leaf_index, (), register, dtype),
+              ('call', operation_name, input_registers, register,
+              (operand_dtypes, dtype)),
+              ('reduce', reducer, input_registers, register, dtype), whose
+              register holds the list of outputs of the reducer,
+              ('initialize', reducer, (input_register,), register, dtype),
+              ('accumulate', reducer, (state_register, input_register),
+              register, dtype),
+              ('finalize', reducer, (state_register,), register, None),
+              whose register holds the list of outputs of the reducer, or
+              ('item', output_index, (input_register,), register, dtype).
+          outputs: The register of each output.
+          registers: The number of registers used by the steps.
+        """
+        self.steps = tuple(steps)
+        self.outputs = tuple(outputs)
+        self.registers = registers
+        self._releases = self._lastUses()
+
+    def signature(self):
+        """Returns a hashable description of the program."""
+        return self.steps, self.outputs
+
+    def __eq__(self, other):
+        return (isinstance(other, Program) and
+                self.signature() == other.signature())
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash(self.signature())
+
+    def _lastUses(self):
+        """Returns, per step, the registers no longer needed after it."""
+        last_use = {}
+        for index, (_, _, inputs, _, _) in enumerate(self.steps):
+            for register in inputs:
+                last_use[register] = index
+
+        releases = [[] for _ in self.steps]
+        outputs = frozenset(self.outputs)
+        for register, index in last_use.items():
+            if register not in outputs:
+                releases[index].append(register)
+        return releases
+
+    def execute(self, backend, load):
+        """Runs the program.
+
+        Every register holds a (data, mask) pair, the mask being None when
+        every pixel is valid and a bool array, False at the masked pixels,
+        otherwise. Operations combine the masks of their operands (see
+        _call()), so a pixel masked in an operand is masked in the result.
+
+        Args:
+          backend: The backend that applies the operations.
+          load: A function returning the (data, mask) arrays of a leaf from
+              its index.
+
+        Returns:
+          The list of (data, mask) arrays of the outputs.
+        """
+        registers = [None] * self.registers
+        for index, step in enumerate(self.steps):
+            kind, target, inputs, register, types = step
+            arguments = [registers[i] for i in inputs]
+            if kind == 'load':
+                registers[register] = load(target)
+            elif kind == 'call':
+                registers[register] = _call(backend, target, arguments,
+                                            types)
+            elif kind == 'reduce':
+                datas = [data for data, _ in arguments]
+                masks = [mask for _, mask in arguments]
+                stack = backend.stack(datas, types)
+                mask = None
+                if any(mask is not None for mask in masks):
+                    mask = backend.stack(
+                        [_TRUE if mask is None else mask for mask in masks],
+                        ge.dtypes.BOOL, tuple(stack.shape[1:]))
+                registers[register] = target.reduce(backend.xp, stack, mask)
+                del datas, masks, stack, mask
+            elif kind == 'initialize':
+                data, mask = arguments[0]
+                registers[register] = target.initialize(
+                    backend.xp, backend.cast(data, types), mask)
+            elif kind == 'accumulate':
+                data, mask = arguments[1]
+                registers[register] = target.accumulate(
+                    backend.xp, arguments[0], backend.cast(data, types), mask)
+            elif kind == 'finalize':
+                registers[register] = target.finalize(backend.xp,
+                                                      arguments[0])
+            else:
+                outputs, valid = arguments[0]
+                registers[register] = (backend.cast(outputs[target], types),
+                                       valid)
+            del arguments
+
+            for released in self._releases[index]:
+                registers[released] = None
+
+        return [registers[register] for register in self.outputs]
+
+
+# Stands for the mask of fully valid operands where a mask array is needed.
+_TRUE = np.True_
+
+
+def _intersect(backend, masks):
+    """Returns the pixels valid in every mask, None if they all are.
+
+    An operand without a mask, or with the mask of another operand, adds no
+    work: the result is then the other mask itself, not a copy.
+    """
+    result = None
+    for mask in masks:
+        if mask is None or mask is result:
+            continue
+        if result is None:
+            result = mask
+        else:
+            result = backend.apply('and', [result, mask],
+                                   [ge.dtypes.BOOL] * 2, ge.dtypes.BOOL)
+    return result
+
+
+def _call(backend, operation, arguments, types):
+    """Applies an operation to (data, mask) operands.
+
+    The result is masked wherever an operand is, except for the operations
+    on masks themselves:
+      updateMask: masked where the input or the mask band is, or the mask
+          band is 0.
+      unmask: the input, with the value band at its masked pixels.
+      mask: the mask of the input as a uint8 band (1 where valid), with no
+          mask.
+      where: masked where the test or the band the pixel is taken from is.
+    """
+    datas = [data for data, _ in arguments]
+    masks = [mask for _, mask in arguments]
+    dtypes, dtype = types
+
+    if operation == 'updateMask':
+        return (backend.cast(datas[0], dtype),
+                _intersect(backend, masks + [backend.cast(datas[1],
+                                                          ge.dtypes.BOOL)]))
+    if operation == 'unmask':
+        if masks[0] is None:
+            return backend.cast(datas[0], dtype), None
+        data = backend.apply('where', [masks[0]] + datas,
+                             [ge.dtypes.BOOL] + list(dtypes), dtype)
+        if masks[1] is None:
+            return data, None
+        return data, backend.apply('or', masks, [ge.dtypes.BOOL] * 2,
+                                   ge.dtypes.BOOL)
+    if operation == 'mask':
+        if masks[0] is None:
+            return backend.asarray(np.ones((), dtype)), None
+        return backend.cast(masks[0], dtype), None
+
+    data = backend.apply(operation, datas, dtypes, dtype)
+    if operation == 'where' and (masks[1] is not None or
+                                 masks[2] is not None):
+        # The mask of the band each pixel is taken from.
+        selected = backend.apply(
+            'where', [datas[0]] + [_TRUE if mask is None else mask
+                                   for mask in masks[1:]],
+            [ge.dtypes.BOOL] * 3, ge.dtypes.BOOL)
+        return data, _intersect(backend, [masks[0], selected])
+    return data, _intersect(backend, masks)
+
+
+class Kernel(object):
+    """A band expression graph flattened into evaluation steps.
+
+    Band operations do not compute anything, they return a Band whose
+    ComputedObject func/args record the operation and its operands. A Kernel
+    walks that graph once and orders it so that:
+    1. A node shared by several consumers (or several output bands) is only
+       computed once.
+    2. Leaves are only read right before their first use. Leaves that are
+       bands of the same file (and window and type) are read together with
+       one GDAL call into a (bands, rows, cols) array, each leaf being a view
+       of it.
+    3. Every intermediate result is dropped as soon as its last consumer ran,
+       so a chain of operations never holds more than a few temporaries.
+    """
+
+    def __init__(self, bands):
+        """Compiles the graph of one or more bands.
+
+        Args:
+          bands: The output bands, evaluated together.
+        """
+        self._leaves = []
+        self._steps = []
+        self._registers = 0
+        # Whether the data of each register may have masked pixels.
+        self._masked = {}
+        # The operand of a streaming reduction each leaf is read for, None
+        # for the leaves read outside of one.
+        self._scope = None
+        self._scopes = []
+        self._nextScope = 0
+        nodes = {}
+        outputs = [self._visit(band, nodes) for band in bands]
+        self._program = Program(self._steps, outputs, self._registers)
+        self._maskable = [self._masked[register] for register in outputs]
+        self._groups = self._readGroups()
+
+    def _visit(self, band, nodes):
+        key = id(band)
+        if key in nodes:
+            return nodes[key]
+
+        if band.isComputed() and band.func == 'reduce':
+            register = self._reduce(band, nodes)
+        elif band.isComputed() and band.func == 'item':
+            input = self._visit(band.args['input'], nodes)
+            register = self._allocate(self._masked[input])
+            self._steps.append(('item', band.args['index'], (input,),
+                                register, band.getDataType()))
+        elif band.isComputed():
+            args = list(band.args.values())
+            inputs = [self._visit(arg, nodes) for arg in args]
+            dtypes, _ = ge.dtypes.promote(
+                band.func, [arg.getDataType() for arg in args],
+                [arg.getConstant() for arg in args])
+            masked = [self._masked[input] for input in inputs]
+            if band.func == 'mask':
+                masked = False
+            elif band.func == 'unmask':
+                masked = all(masked)
+            else:
+                masked = band.func == 'updateMask' or any(masked)
+            register = self._allocate(masked)
+            self._steps.append(('call', band.func, tuple(inputs), register,
+                                (tuple(dtypes), band.getDataType())))
+        else:
+            register = self._allocate(band.hasMask())
+            self._steps.append(('load', len(self._leaves), (), register,
+                                band.getDataType()))
+            self._leaves.append(band)
+            self._scopes.append(self._scope)
+
+        nodes[key] = register
+        return register
+
+    def _reduce(self, band, nodes):
+        reducer = band.args['reducer']
+        operands = [arg for name, arg in band.args.items()
+                    if name not in ('reducer', 'stacked')]
+        dtype = band.getDataType()
+
+        if band.args['stacked'] or not reducer.streaming():
+            inputs = [self._visit(arg, nodes) for arg in operands]
+            register = self._allocate(self._reductionMasked(reducer,
+                                                            inputs))
+            self._steps.append(('reduce', reducer, tuple(inputs), register,
+                                dtype))
+            return register
+
+        # Each operand is loaded right before it is accumulated and dropped
+        # right after, so only one of them is held at a time.
+        state = None
+        inputs = []
+        for arg in operands:
+            scope = self._scope
+            self._scope = self._nextScope
+            self._nextScope += 1
+            input = self._visit(arg, nodes)
+            self._scope = scope
+            inputs.append(input)
+            register = self._allocate(False)
+            if state is None:
+                self._steps.append(('initialize', reducer, (input,),
+                                    register, dtype))
+            else:
+                self._steps.append(('accumulate', reducer, (state, input),
+                                    register, dtype))
+            state = register
+
+        register = self._allocate(self._reductionMasked(reducer, inputs))
+        self._steps.append(('finalize', reducer, (state,), register, None))
+        return register
+
+    def _reductionMasked(self, reducer, inputs):
+        # Pixels are only masked in the outputs if every value is masked,
+        # and counts are never masked.
+        return (reducer.getName() != 'count' and
+                any(self._masked[input] for input in inputs))
+
+    def _allocate(self, masked):
+        register = self._registers
+        self._registers += 1
+        self._masked[register] = masked
+        return register
+
+    def _readGroups(self):
+        """Returns, per leaf read with others, the indices of its group.
+
+        Leaves read for different operands of a streaming reduction are
+        never grouped: the bands read early would otherwise be held until
+        their own operand is accumulated, e.g. every band of every image
+        of a collection.
+        """
+        groups = {}
+        for index, leaf in enumerate(self._leaves):
+            source = leaf.getSource()
+            if source is None:
+                continue
+            key = (source.datasetKey(), leaf.getWindow(),
+                   source.band().DataType, self._scopes[index])
+            groups.setdefault(key, []).append(index)
+
+        leaf_groups = {}
+        for group in groups.values():
+            if len(group) > 1:
+                for index in group:
+                    leaf_groups[index] = tuple(group)
+        return leaf_groups
+
+    def leaves(self):
+        """Returns the bands read by the kernel, in evaluation order."""
+        return list(self._leaves)
+
+    def program(self):
+        return self._program
+
+    def maskable(self):
+        """Returns, per output band, whether it may have masked pixels."""
+        return list(self._maskable)
+
+    def __call__(self, window=None):
+        """Evaluates the output bands.
+
+        Args:
+          window: (xoff, yoff, xsize, ysize) in pixels of the bands. If
+              unspecified, the whole bands are computed.
+
+        Returns:
+          A list with the data of each output band, as arrays of the
+          current backend.
+        """
+        return [data for data, _ in self.evaluate(window)]
+
+    def evaluate(self, window=None):
+        """Evaluates the output bands and their masks.
+
+        Args:
+          window: (xoff, yoff, xsize, ysize) in pixels of the bands. If
+              unspecified, the whole bands are computed.
+
+        Returns:
+          A list with the (data, mask) of each output band, as arrays of the
+          current backend. A mask is None if every pixel of the band is
+          valid, else a bool array, False at the masked pixels.
+        """
+        backend = ge.backend.current()
+        # Leaves read by the group of an earlier leaf, until they are loaded.
+        read = {}
+
+        def load(index):
+            data = read.pop(index, None)
+            if data is None and index in self._groups:
+                group = self._groups[index]
+                leaves = [self._leaves[i] for i in group]
+                stack = RasterSource.readBands(
+                    [leaf.getSource() for leaf in leaves],
+                    leaves[0].getWindow(window))
+                read.update(zip(group, stack))
+                data = read.pop(index)
+            elif data is None:
+                data = self._leaves[index].getData(window)
+            mask = self._leaves[index].getMask(window, data)
+            if mask is not None:
+                mask = backend.asarray(mask)
+            return backend.asarray(data), mask
+
+        return backend.run(self._program, load)
@@ -1,6 +1,4 @@
-import re
-
-from osgeo import osr
+from ge.tools import SRS
 
 
 class Projection(object):
@@ -24,15 +22,8 @@ class Projection(object):
         both this and 'transform'.
         """
         if (crs):
-            self._crs = osr.SpatialReference()
-            search = re.search('EPSG:(\w+)', crs)
-            if (search and len(search.groups()) >= 1):
-                epsg_code = int(search.groups()[0])
-                self._crs.ImportFromEPSG(epsg_code)
-            else:
-                self._crs.ImportFromWkt(crs)
-
-            self._transformWkt = self._crs.ExportToWkt()
+            self._crs = SRS.Get(crs)
+            self._transformWkt = SRS.Wkt(crs)
         else:
             self._transform = transform
             self._transformWkt = transformWkt
@@ -52,7 +43,7 @@ class Projection(object):
         found in any available database
         """
         if (self._crs):
-            return self._crs.ExportToWkt()
+            return self._transformWkt
         else:
             return None
 
@@ -1,23 +1,488 @@
-import tensorflow as tf
+#!/usr/bin/env python
+"""Per-pixel reductions of stacks of bands."""
+
+import math
+
+import numpy as np
+
+import ge.dtypes
+import ge.ee_exception
+
+
+# Reducers with an online algorithm, which keep a fixed size state per
+# pixel instead of the whole stack.
+_STREAMING = frozenset(['sum', 'min', 'max', 'count', 'mean', 'variance',
+                        'stdDev'])
+
+# The number of histogram buckets of approximate percentiles by default.
+DEFAULT_MAX_BUCKETS = 100
+
+# The type of the histogram counts, which caps approximate percentiles to
+# collections of 65535 images.
+_BUCKET_COUNT_TYPE = np.uint16
+
+
+def _fill(xp, array, mask, value):
+    """Returns the array with value at the masked pixels."""
+    if mask is None:
+        return array
+    return xp.where(mask, array, value)
+
+
+def _valid(xp, array, mask):
+    """Returns the pixels that are neither masked nor NaN."""
+    if mask is None:
+        return array == array
+    return xp.logical_and(mask, array == array)
+
+
+def _highest(dtype):
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'f':
+        return np.inf
+    if dtype.kind == 'b':
+        return True
+    return np.iinfo(dtype).max
+
+
+def _lowest(dtype):
+    dtype = np.dtype(dtype)
+    if dtype.kind == 'f':
+        return -np.inf
+    if dtype.kind == 'b':
+        return False
+    return np.iinfo(dtype).min
 
 
 class Reducer(object):
+    """A per-pixel reduction, e.g. the mean of a band over a collection.
+
+    Reducers do not fold images pairwise. They run in one of two modes, on
+    the arrays of the backend (numpy or tf.experimental.numpy):
+    1. Stacked: the bands to reduce are stacked along a new first axis, a
+       tile at a time, and reduced by one vectorized call (reduce()). Exact
+       percentiles need this.
+    2. Streaming: the bands are consumed one at a time by an online
+       algorithm (initialize(), accumulate(), finalize()), so reducing a
+       collection holds one band tile plus a fixed size state per pixel,
+       whatever the size of the collection. Collections are reduced this
+       way by the reducers that support it, see streaming().
+    In both modes masked values are left out: each pixel is reduced over
+    its valid values, and pixels without any are masked in the outputs
+    (except for count(), which is 0 there).
+    Reducers compare equal by name and parameters, so kernels using equal
+    reducers share their programs.
+    """
+
+    def __init__(self, name, **params):
+        """Creates a reducer, see the static constructors.
+
+        Args:
+          name: The name of the reduction, e.g. 'mean'.
+          **params: The parameters of the reduction, as hashable values.
+        """
+        self._name = name
+        self._params = params
+
+    def getName(self):
+        return self._name
+
+    def streaming(self):
+        """Returns whether the reducer has an online algorithm."""
+        return self._name in _STREAMING or self._sketched()
+
+    def _sketched(self):
+        # Percentiles given a value range are computed from a histogram.
+        return (self._name == 'percentile' and
+                self._params.get('maxBuckets') is not None)
+
+    def outputs(self):
+        """Returns the names of the outputs of the reducer."""
+        if self._name == 'percentile':
+            return list(self._params['outputNames'])
+        return [self._name]
+
+    def types(self, dtype):
+        """Returns the types of a reduction of bands of a type.
+
+        Args:
+          dtype: The numpy dtype of the bands.
+
+        Returns:
+          A (compute dtype, output dtypes) tuple: the bands are stacked in
+          the compute dtype, and each output has its own dtype.
+        """
+        dtype = np.dtype(dtype)
+        if self._name in ('min', 'max'):
+            return dtype, [dtype]
+        if self._name == 'count':
+            return dtype, [np.dtype(np.uint32)]
+        if self._name == 'argmax':
+            return dtype, [np.dtype(np.uint16)]
+        if self._name == 'sum':
+            if dtype.kind == 'f':
+                return dtype, [dtype]
+            return np.dtype(np.int64), [np.dtype(np.int64)]
+        floating = ge.dtypes.union([np.float32, dtype])
+        return floating, [floating] * len(self.outputs())
+
+    def reduce(self, xp, stack, mask=None):
+        """Reduces a stack of bands along its first axis.
+
+        Args:
+          xp: The array module of the backend.
+          stack: The (images, rows, cols) array of the bands.
+          mask: None if every value is valid, else a bool array of the
+              shape of stack, False for the masked values, which are left
+              out of the reduction.
+
+        Returns:
+          An (outputs, valid) tuple: the list of (rows, cols) arrays of the
+          outputs, and the pixels with at least one valid value, None if
+          that is every pixel. Outputs are undefined elsewhere.
+        """
+        if mask is None:
+            return self._reduce(xp, stack), None
+
+        count = xp.sum(mask, axis=0)
+        valid = count > 0
+        if self._name == 'count':
+            return [xp.sum(xp.logical_and(mask, stack == stack),
+                           axis=0)], None
+        if self._name == 'sum':
+            return [xp.sum(xp.where(mask, stack, 0), axis=0)], valid
+        if self._name == 'min':
+            return [xp.min(xp.where(mask, stack, _highest(stack.dtype)),
+                           axis=0)], valid
+        if self._name == 'max':
+            return [xp.max(xp.where(mask, stack, _lowest(stack.dtype)),
+                           axis=0)], valid
+        if self._name == 'argmax':
+            return [xp.argmax(xp.where(mask, stack, _lowest(stack.dtype)),
+                              axis=0)], valid
+        if self._name == 'percentile':
+            return self._maskedPercentiles(xp, stack, mask), valid
+        if self._name in ('mean', 'variance', 'stdDev'):
+            count = xp.maximum(count, 1)
+            mean = xp.sum(xp.where(mask, stack, 0), axis=0) / count
+            if self._name == 'mean':
+                return [mean], valid
+            squares = xp.sum(xp.where(mask, (stack - mean) ** 2, 0), axis=0)
+            if self._name == 'variance':
+                return [squares / count], valid
+            return [xp.sqrt(squares / count)], valid
+        raise ge.ee_exception.EEException(
+            'Unknown reducer: {name}'.format(name=self._name))
+
+    def _reduce(self, xp, stack):
+        if self._name == 'sum':
+            return [xp.sum(stack, axis=0)]
+        if self._name == 'min':
+            return [xp.min(stack, axis=0)]
+        if self._name == 'max':
+            return [xp.max(stack, axis=0)]
+        if self._name == 'mean':
+            return [xp.mean(stack, axis=0)]
+        if self._name == 'count':
+            # NaN is the only value not equal to itself.
+            return [xp.sum(stack == stack, axis=0)]
+        if self._name == 'variance':
+            return [xp.var(stack, axis=0)]
+        if self._name == 'stdDev':
+            return [xp.std(stack, axis=0)]
+        if self._name == 'argmax':
+            return [xp.argmax(stack, axis=0)]
+        if self._name == 'percentile':
+            return self._percentiles(xp, stack)
+        raise ge.ee_exception.EEException(
+            'Unknown reducer: {name}'.format(name=self._name))
+
+    def initialize(self, xp, array, mask=None):
+        """Returns the state of a streaming reduction of one band.
+
+        Args:
+          xp: The array module of the backend.
+          array: The first band, in the compute dtype (see types()).
+          mask: None if every pixel of the band is valid, else a bool array,
+              False for the masked pixels, which are left out.
+        """
+        return self._initialize(xp, array, mask), mask
+
+    def accumulate(self, xp, state, array, mask=None):
+        """Returns the state of a streaming reduction after one more band."""
+        state, valid = state
+        if valid is not None and mask is not None:
+            valid = xp.logical_or(valid, mask)
+        else:
+            valid = None
+        return self._accumulate(xp, state, array, mask), valid
+
+    def finalize(self, xp, state):
+        """Returns the outputs of a streaming reduction, as reduce()."""
+        state, valid = state
+        if self._name == 'count':
+            return [state], None
+        if self._name in ('sum', 'min', 'max'):
+            return [state], valid
+        if self._sketched():
+            return self._sketchPercentiles(xp, state), valid
+        count, mean, squares = state
+        if self._name == 'mean':
+            return [mean], valid
+        if valid is not None:
+            count = xp.maximum(count, 1)
+        if self._name == 'variance':
+            return [squares / count], valid
+        return [xp.sqrt(squares / count)], valid
+
+    def _initialize(self, xp, array, mask):
+        if self._name == 'sum':
+            return _fill(xp, array, mask, 0)
+        if self._name == 'min':
+            return _fill(xp, array, mask, _highest(array.dtype))
+        if self._name == 'max':
+            return _fill(xp, array, mask, _lowest(array.dtype))
+        if self._name == 'count':
+            return xp.where(_valid(xp, array, mask), 1, 0)
+        if self._sketched():
+            buckets = self._params['maxBuckets']
+            counts = xp.zeros((buckets,) + tuple(array.shape),
+                              dtype=_BUCKET_COUNT_TYPE)
+            return self._accumulate(xp, counts, array, mask)
+        # Welford's algorithm: the count, the mean and the sum of squared
+        # differences to the mean, updated without cancellation. The count
+        # is per pixel once a band is masked.
+        if mask is None:
+            return 1, array, xp.zeros_like(array)
+        return (xp.asarray(mask, dtype=array.dtype),
+                _fill(xp, array, mask, 0), xp.zeros_like(array))
+
+    def _accumulate(self, xp, state, array, mask):
+        if self._name == 'sum':
+            return state + _fill(xp, array, mask, 0)
+        if self._name == 'min':
+            return xp.minimum(state,
+                              _fill(xp, array, mask, _highest(array.dtype)))
+        if self._name == 'max':
+            return xp.maximum(state,
+                              _fill(xp, array, mask, _lowest(array.dtype)))
+        if self._name == 'count':
+            return state + xp.where(_valid(xp, array, mask), 1, 0)
+        if self._sketched():
+            if xp is np:
+                return self._count(state, array, mask)
+            return state + (self._bucket(xp, array, mask) ==
+                            self._buckets(xp, array))
+        count, mean, squares = state
+        if mask is None:
+            count = count + 1
+            delta = array - mean
+            mean = mean + delta / count
+        else:
+            # Masked pixels may hold NaN, which 0 * NaN would carry into
+            # the squares.
+            array = _fill(xp, array, mask, 0)
+            count = count + xp.asarray(mask, dtype=array.dtype)
+            delta = xp.where(mask, array - mean, 0)
+            mean = mean + delta / xp.maximum(count, 1)
+        squares = squares + delta * (array - mean)
+        return count, mean, squares
+
+    def _width(self):
+        return ((self._params['maxValue'] - self._params['minValue']) /
+                float(self._params['maxBuckets']))
+
+    def _buckets(self, xp, array):
+        # The bucket indices, along the first axis.
+        shape = (self._params['maxBuckets'],) + (1,) * len(array.shape)
+        return xp.reshape(xp.arange(self._params['maxBuckets']), shape)
+
+    def _bucket(self, xp, array, mask):
+        # The bucket of each value, values out of range fall in the first or
+        # last bucket and NaN and masked values in none.
+        bucket = xp.floor((array - self._params['minValue']) / self._width())
+        bucket = xp.clip(bucket, 0, self._params['maxBuckets'] - 1)
+        return xp.where(_valid(xp, array, mask), bucket, -1)
+
+    def _count(self, counts, array, mask):
+        # Each pixel adds its value to one bucket, so the (bucket, pixel)
+        # indices are distinct and the counts are incremented in place,
+        # without comparing the values with every bucket.
+        bucket = np.reshape(self._bucket(np, array, mask), -1)
+        pixels = np.flatnonzero(bucket >= 0)
+        flat = np.reshape(counts, (counts.shape[0], -1))
+        flat[bucket[pixels].astype(np.intp), pixels] += 1
+        return counts
+
+    def _sketchPercentiles(self, xp, counts):
+        cumulative = xp.cumsum(counts, axis=0, dtype=np.uint32)
+        total = cumulative[-1]
+        values = []
+        for percentile in self._params['percentiles']:
+            # The bucket of the value of rank floor(p * (n - 1)) is the
+            # number of buckets holding no more than that many values.
+            rank = xp.floor(percentile / 100.0 * (total - 1.0))
+            bucket = xp.sum(cumulative <= rank, axis=0)
+            value = (self._params['minValue'] +
+                     (bucket + 0.5) * self._width())
+            values.append(xp.where(total > 0, value, np.nan))
+        return values
+
+    def _percentiles(self, xp, stack):
+        # Linear interpolation between the closest ranks, as numpy's
+        # percentile. The ranks only depend on the stack depth, so the
+        # values are plain slices of the sorted stack.
+        ordered = xp.sort(stack, axis=0)
+        last = stack.shape[0] - 1
+        values = []
+        for percentile in self._params['percentiles']:
+            rank = percentile / 100.0 * last
+            lower = int(math.floor(rank))
+            upper = min(lower + 1, last)
+            fraction = rank - lower
+            value = ordered[lower]
+            if fraction:
+                value = value + (ordered[upper] - value) * fraction
+            values.append(value)
+        return values
+
+    def _maskedPercentiles(self, xp, stack, mask):
+        # As _percentiles(), but each pixel has its own number of values:
+        # masked values become NaN, which sorts last, and the values at the
+        # ranks of each pixel are picked along the first axis.
+        ordered = xp.sort(xp.where(mask, stack, np.nan), axis=0)
+        last = xp.sum(ordered == ordered, axis=0) - 1
+        index = xp.reshape(xp.arange(stack.shape[0]),
+                           (-1,) + (1,) * (len(stack.shape) - 1))
+        values = []
+        for percentile in self._params['percentiles']:
+            rank = percentile / 100.0 * last
+            lower = xp.floor(rank)
+            upper = xp.minimum(lower + 1, last)
+            value = xp.sum(xp.where(index == lower, ordered, 0), axis=0)
+            upper = xp.sum(xp.where(index == upper, ordered, 0), axis=0)
+            values.append(value + (upper - value) * (rank - lower))
+        return values
+
+    def __eq__(self, other):
+        return (isinstance(other, Reducer) and
+                self._name == other._name and
+                self._params == other._params)
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    def __hash__(self):
+        return hash((self._name, tuple(sorted(self._params.items()))))
+
+    def __repr__(self):
+        return 'Reducer.{name}({params})'.format(
+            name=self._name,
+            params=', '.join('{0}={1!r}'.format(key, value) for key, value
+                             in sorted(self._params.items())))
+
     @staticmethod
     def sum():
-        return tf.reduce_sum
+        return Reducer('sum')
 
     @staticmethod
     def min():
-        return tf.reduce_min
+        return Reducer('min')
 
     @staticmethod
     def max():
-        return tf.reduce_max
+        return Reducer('max')
 
     @staticmethod
     def mean():
-        return tf.reduce_mean
+        return Reducer('mean')
+
+    @staticmethod
+    def variance():
+        """Computes the population variance."""
+        return Reducer('variance')
+
+    @staticmethod
+    def stdDev():
+        """Computes the population standard deviation."""
+        return Reducer('stdDev')
+
+    @staticmethod
+    def count():
+        """Counts the values that are neither masked nor NaN."""
+        return Reducer('count')
+
+    @staticmethod
+    def argmax():
+        """Computes the index of the largest value.
+
+        In Image.reduce() that is the index of the band with the largest
+        value. Ties go to the first index.
+        """
+        return Reducer('argmax')
+
+    @staticmethod
+    def median(maxBuckets=None, minValue=None, maxValue=None):
+        """Computes the median, see percentile()."""
+        return Reducer.percentile([50], ['median'], maxBuckets, minValue,
+                                  maxValue)
+
+    @staticmethod
+    def percentile(percentiles, outputNames=None, maxBuckets=None,
+                   minValue=None, maxValue=None):
+        """Computes percentiles.
+
+        By default the percentiles are exact, interpolated linearly between
+        values as numpy's percentile. That needs every value of a pixel at
+        once: reducing a collection stacks the band of every image for each
+        tile.
+
+        Given the range of the values, the percentiles are approximated
+        from a histogram of maxBuckets buckets per pixel instead, which is
+        filled one image at a time. A tile then holds one band plus
+        2 * maxBuckets bytes per pixel whatever the collection size (up to
+        65535 images). Each result is the center of the bucket holding the
+        value of rank floor(p * (n - 1) / 100) of the pixel, so it is at most
+        (maxValue - minValue) / maxBuckets / 2 away from that value, the
+        lower of the two values the exact percentile interpolates between.
+        Values out of the range count in the first or last bucket.
+
+        Args:
+          percentiles: The percentiles to compute, between 0 and 100.
+          outputNames: The names of the outputs, by default 'p<percentile>'
+              (e.g. 'p90').
+          maxBuckets: The number of histogram buckets, DEFAULT_MAX_BUCKETS
+              if only the range is given.
+          minValue: The smallest value of the histogram.
+          maxValue: The largest value of the histogram.
+        """
+        if (minValue is None) != (maxValue is None):
+            raise ge.ee_exception.EEException(
+                'Approximate percentiles need both minValue and maxValue.')
+        if maxBuckets is not None and minValue is None:
+            raise ge.ee_exception.EEException(
+                'maxBuckets needs minValue and maxValue.')
+        if minValue is not None:
+            if minValue >= maxValue:
+                raise ge.ee_exception.EEException(
+                    'minValue must be smaller than maxValue.')
+            maxBuckets = maxBuckets or DEFAULT_MAX_BUCKETS
+        if any(p < 0 or p > 100 for p in percentiles):
+            raise ge.ee_exception.EEException(
+                'Percentiles must be between 0 and 100.')
+        if outputNames is None:
+            outputNames = ['p{percentile:g}'.format(percentile=p)
+                           for p in percentiles]
+        if len(outputNames) != len(percentiles):
+            raise ge.ee_exception.EEException(
+                'There must be one output name per percentile.')
+        return Reducer('percentile',
+                       percentiles=tuple(percentiles),
+                       outputNames=tuple(outputNames),
+                       maxBuckets=maxBuckets,
+                       minValue=minValue,
+                       maxValue=maxValue)
 
     @staticmethod
     def name():
-        return 'Reduce'
+        return 'Reducer'
@@ -1,2 +1,4 @@
 from .raster import Raster
+from .source import MemoryFiles, RasterSource
 from .vector import Vector
+from .srs import SRS
@@ -1,83 +1,138 @@
-import numpy
-from osgeo import gdal, osr
+import math
 
-from .vector import Vector
+from osgeo import gdal, ogr
+
+# The memory used by gdal.Warp for its chunks by default, in bytes.
+WARP_MEMORY_LIMIT = 512 * 1024 * 1024
 
 
 class Raster(object):
     @staticmethod
-    def ClipByGeometry(dataset, geo_json, all_touched=False):
-        shape = Vector.Shape(geo_json)
-        layer = shape.GetLayer()
-
-        feat = Vector.ReprojetLayer(layer, dataset.GetProjectionRef())
-
-        pointsX, pointsY = Raster.get_extent_of_feat(feat)
-
-        x_origin, pixel_width, _, y_origin, _, pixel_height = dataset.GetGeoTransform()
-
-        xmin, xmax, ymin, ymax = Raster.get_extent_coords(pointsX, pointsY)
-        xoff, yoff, xcount, ycount = Raster.specify_offset_of_rows_and_columns(xmin, xmax, ymin, ymax, x_origin,
-                                                                               y_origin, pixel_width)
-
-        mem_dataset = gdal.GetDriverByName('MEM').Create('', xcount, ycount, dataset.RasterCount,
-                                                         dataset.GetRasterBand(1).DataType)
-        mem_dataset.SetProjection(dataset.GetProjectionRef())
-        mem_dataset.SetGeoTransform((xmin, pixel_width, 0, ymax, 0, pixel_height))
+    def GeometryWindow(geometry, transform, cols, rows):
+        """
+        Returns the (xoff, yoff, xsize, ysize) window of a grid covering
+        the envelope of a geometry, clipped to the grid. A geometry outside
+        the grid gets the closest one pixel window.
+
+        :param geometry: An OGR geometry, in the CRS of the grid.
+        :param transform: The GDAL geotransform of the grid.
+        """
+        xmin, xmax, ymin, ymax = geometry.GetEnvelope()
+        inverse = gdal.InvGeoTransform(transform)
+        corners = [gdal.ApplyGeoTransform(inverse, x, y)
+                   for x in (xmin, xmax) for y in (ymin, ymax)]
+        columns = [corner[0] for corner in corners]
+        lines = [corner[1] for corner in corners]
+
+        xoff = min(max(int(math.floor(min(columns))), 0), cols - 1)
+        yoff = min(max(int(math.floor(min(lines))), 0), rows - 1)
+        xend = max(min(int(math.ceil(max(columns))), cols), xoff + 1)
+        yend = max(min(int(math.ceil(max(lines))), rows), yoff + 1)
+        return xoff, yoff, xend - xoff, yend - yoff
 
-        gdal.RasterizeLayer(mem_dataset, [1], layer, burn_values=[1], options=["ALL_TOUCHED={}".format(all_touched)])
-
-        for i in range(1, mem_dataset.RasterCount + 1):
-            dataset_array = dataset.GetRasterBand(i).ReadAsArray().astype(numpy.float)[yoff:yoff + ycount,
-                            xoff:xoff + xcount]
-            dataset_mask = dataset.GetRasterBand(i).ReadAsArray().astype(numpy.float)[0:dataset_array.shape[0],
-                           0:dataset_array.shape[1]]
-
-            zoneraster = numpy.ma.masked_array(dataset_array, numpy.logical_not(dataset_mask))
-            zoneraster.set_fill_value(numpy.nan)
-
-            mem_dataset.GetRasterBand(i).WriteArray(zoneraster)
+    @staticmethod
+    def WindowTransform(transform, xoff, yoff):
+        """
+        Returns the geotransform of a grid starting at a pixel of another.
+        """
+        x_origin, pixel_width, x_rotation, y_origin, y_rotation, \
+            pixel_height = transform
+        return (x_origin + xoff * pixel_width + yoff * x_rotation,
+                pixel_width, x_rotation,
+                y_origin + xoff * y_rotation + yoff * pixel_height,
+                y_rotation, pixel_height)
 
-        return mem_dataset
+    @staticmethod
+    def RasterizeGeometry(geometry, transform, cols, rows,
+                          all_touched=False):
+        """
+        Returns the pixels of a grid covered by a geometry, as a bool
+        array.
+
+        :param geometry: An OGR geometry, in the CRS of the grid.
+        :param transform: The GDAL geotransform of the grid.
+        """
+        mask_dataset = gdal.GetDriverByName('MEM').Create(
+            '', cols, rows, 1, gdal.GDT_Byte)
+        mask_dataset.SetGeoTransform(transform)
+
+        shape = ogr.GetDriverByName('MEMORY').CreateDataSource('')
+        layer = shape.CreateLayer('mask', None, ogr.wkbUnknown)
+        feature = ogr.Feature(layer.GetLayerDefn())
+        feature.SetGeometry(geometry)
+        layer.CreateFeature(feature)
+
+        gdal.RasterizeLayer(mask_dataset, [1], layer, burn_values=[1],
+                            options=["ALL_TOUCHED={}".format(
+                                'TRUE' if all_touched else 'FALSE')])
+        return mask_dataset.GetRasterBand(1).ReadAsArray() != 0
 
     @staticmethod
     def Reproject(dataset, crs, crsTransform=None, scale=None):
+        """
+        Reprojects every band of a dataset at once, see Warp().
+        """
+        return Raster.Warp(dataset, crs, crsTransform, scale)
 
-        crs_from = osr.SpatialReference(wkt=dataset.GetProjectionRef())
-        crs_to = osr.SpatialReference(wkt=crs)
-
-        tx = osr.CoordinateTransformation(crs_from, crs_to)
-
-        x_size = dataset.RasterXSize
-        y_size = dataset.RasterYSize
-
-        transform = dataset.GetGeoTransform()
-        if not crsTransform:
-            crsTransform = transform
-
-        # Work out the boundaries of the new dataset in the target projection
-        (ulx, uly, ulz) = tx.TransformPoint(crsTransform[0], crsTransform[3])
-        (lrx, lry, lrz) = tx.TransformPoint(crsTransform[0] + crsTransform[1] * x_size,
-                                            crsTransform[3] + crsTransform[5] * y_size)
-
-        # create file in memory
-        mem_dataset = gdal.GetDriverByName('MEM')
-
-        # calculate new properties output result
-        if scale:
-            new_x, new_y = int((lrx - ulx) / scale), int((uly - lry) / scale)
-            dest = mem_dataset.Create('', new_x, new_y, 1, gdal.GDT_Float32)
-            crsTransform = (ulx, scale, crsTransform[2], uly, crsTransform[4], -scale)
-        else:
-            new_x, new_y = int(lrx - ulx), int(uly - lry)
-            dest = mem_dataset.Create('', new_x, new_y, 1, gdal.GDT_Float32)
-
-        dest.SetGeoTransform(crsTransform)
-        dest.SetProjection(crs_to.ExportToWkt())
-
-        gdal.ReprojectImage(dataset, dest, crs_from.ExportToWkt(), crs_to.ExportToWkt(), gdal.GRA_NearestNeighbour)
-
-        return dest
+    @staticmethod
+    def Warp(dataset, crs, transform=None, scale=None, resampling='near',
+             warpMemoryLimit=None, format='MEM', destination=''):
+        """
+        Warps every band of a dataset to another CRS with one gdal.Warp
+        call, on all the CPUs. Pixels keep the type of the dataset, nodata
+        values carry over, and a per-dataset mask band becomes the last,
+        alpha band of the result.
+
+        :param crs: The target CRS, as WKT or an authority code.
+        :param transform: Optional GDAL geotransform whose pixel size and
+        alignment the result takes.
+        :param scale: Optional pixel size in units of crs, if transform is
+        not given. By default GDAL keeps about the resolution of dataset.
+        :param resampling: The GDAL resampling method, e.g. 'near',
+        'bilinear', 'cubic' or 'average'.
+        :param warpMemoryLimit: The memory used by the warper for its
+        chunks, in bytes. Defaults to WARP_MEMORY_LIMIT.
+        :param format: The driver of the result, e.g. 'MEM' or 'VRT'.
+        :param destination: The path of the result, '' for MEM.
+        """
+        band = dataset.GetRasterBand(1)
+        options = {
+            'format': format,
+            'dstSRS': crs,
+            'resampleAlg': resampling,
+            'outputType': band.DataType,
+            'multithread': True,
+            'warpOptions': ['NUM_THREADS=ALL_CPUS'],
+            'warpMemoryLimit': warpMemoryLimit or WARP_MEMORY_LIMIT,
+        }
+        if band.GetMaskFlags() == gdal.GMF_PER_DATASET:
+            options['dstAlpha'] = True
+
+        if transform is not None:
+            pixel_width, pixel_height = transform[1], transform[5]
+            options['xRes'] = abs(pixel_width)
+            options['yRes'] = abs(pixel_height)
+            # The extent GDAL picks for that resolution, snapped to the
+            # pixels of transform.
+            suggested = gdal.Warp('', dataset, format='VRT', dstSRS=crs,
+                                  xRes=abs(pixel_width),
+                                  yRes=abs(pixel_height))
+            x_origin, _, _, y_origin, _, _ = suggested.GetGeoTransform()
+            x_end = x_origin + suggested.RasterXSize * abs(pixel_width)
+            y_end = y_origin - suggested.RasterYSize * abs(pixel_height)
+            left = math.floor((x_origin - transform[0]) / pixel_width)
+            right = math.ceil((x_end - transform[0]) / pixel_width)
+            top = math.floor((y_origin - transform[3]) / pixel_height)
+            bottom = math.ceil((y_end - transform[3]) / pixel_height)
+            options['outputBounds'] = (
+                transform[0] + left * pixel_width,
+                transform[3] + bottom * pixel_height,
+                transform[0] + right * pixel_width,
+                transform[3] + top * pixel_height)
+        elif scale:
+            options['xRes'] = options['yRes'] = scale
+
+        return gdal.Warp(destination, dataset, **options)
 
     @staticmethod
     def get_extent_of_feat(feat):
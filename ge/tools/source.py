@@ -0,0 +1,217 @@
+import pickle
+import threading
+import weakref
+
+import numpy as np
+from osgeo import gdal
+from osgeo import gdal_array
+
+
+class MemoryFiles(object):
+    """
+    In-memory (/vsimem) files, unlinked once the object is released, i.e.
+    once every source holding it is.
+    """
+
+    def __init__(self, *paths):
+        self._paths = paths
+        weakref.finalize(self, MemoryFiles._unlink, paths)
+
+    def paths(self):
+        return self._paths
+
+    @staticmethod
+    def _unlink(paths):
+        for path in paths:
+            gdal.Unlink(path)
+
+
+class RasterSource(object):
+    """
+    A lazy handle to one band of a GDAL dataset.
+
+    Creating a source reads no pixels: data is only fetched by read(), and
+    only for the window that is asked for.
+
+    GDAL datasets must not be used by several threads at once, so threads
+    other than the one that opened the dataset read through their own handle
+    on the same path. Datasets that cannot be reopened (MEM) are shared
+    behind a lock instead.
+    """
+
+    # Datasets reopened by the current thread, keyed by path.
+    _local = threading.local()
+
+    # Serializes reads of datasets that cannot be reopened.
+    _lock = threading.Lock()
+
+    def __init__(self, dataset, index, files=None):
+        """
+        :param dataset: The opened GDAL dataset (shared by every band of the
+        same file).
+        :param index: The 1-based index of the band in the dataset.
+        :param files: The MemoryFiles the dataset is read from, if any, which
+        are unlinked once no source holds them.
+        """
+        self._dataset = dataset
+        self._index = index
+        self._files = files
+        self._path = dataset.GetDescription()
+        self._shared = (not self._path or
+                        dataset.GetDriver().ShortName == 'MEM')
+        self._owner = threading.get_ident()
+        # Nodata values are compared by the bands (see Band.getMask()), only
+        # mask bands (alpha, internal or .msk masks) are read from GDAL.
+        self._masked = not (dataset.GetRasterBand(index).GetMaskFlags() &
+                            (gdal.GMF_ALL_VALID | gdal.GMF_NODATA))
+
+    def __getstate__(self):
+        if self.inMemory():
+            raise pickle.PicklingError(
+                "In memory datasets can only be read by threads.")
+        state = self.__dict__.copy()
+        state['_dataset'] = None
+        state['_owner'] = None
+        return state
+
+    def dataset(self):
+        if self._dataset is not None and (
+                self._shared or self._owner == threading.get_ident()):
+            return self._dataset
+
+        datasets = getattr(RasterSource._local, 'datasets', None)
+        if datasets is None:
+            datasets = RasterSource._local.datasets = {}
+        dataset = datasets.get(self._path)
+        if dataset is None:
+            dataset = datasets[self._path] = gdal.Open(self._path)
+        return dataset
+
+    def path(self):
+        return self._path
+
+    def inMemory(self):
+        """
+        Returns whether the dataset only exists in this process (MEM or
+        /vsimem), so that it cannot be read by other processes.
+        """
+        return self._shared or self._path.startswith('/vsimem/')
+
+    def datasetKey(self):
+        """
+        Returns a key equal for the sources of the same dataset.
+        """
+        if self._shared:
+            return id(self._dataset)
+        return self._path
+
+    def index(self):
+        return self._index
+
+    def band(self):
+        return self.dataset().GetRasterBand(self._index)
+
+    def cols(self):
+        return self.dataset().RasterXSize
+
+    def rows(self):
+        return self.dataset().RasterYSize
+
+    def blockSize(self):
+        """
+        Returns the (cols, rows) size of the natural block of the band.
+        """
+        return tuple(self.band().GetBlockSize())
+
+    def read(self, window=None):
+        """
+        Reads the pixels of a window of the band.
+
+        :param window: (xoff, yoff, xsize, ysize) in pixels of the dataset.
+        If unspecified, the whole band is read.
+        """
+        if self._shared:
+            with RasterSource._lock:
+                return self._read(window)
+        return self._read(window)
+
+    @staticmethod
+    def readBands(sources, window=None):
+        """
+        Reads a window of several bands of the same dataset with one GDAL
+        call.
+
+        :param sources: RasterSources of the same dataset (see datasetKey())
+        and pixel type.
+        :param window: (xoff, yoff, xsize, ysize) in pixels of the dataset.
+        If unspecified, the whole bands are read.
+        :return: A contiguous, read-only (bands, rows, cols) array, in the
+        order of sources.
+        """
+        if sources[0]._shared:
+            with RasterSource._lock:
+                return RasterSource._readBands(sources, window)
+        return RasterSource._readBands(sources, window)
+
+    @staticmethod
+    def _readBands(sources, window):
+        first = sources[0]
+        if window is None:
+            window = (0, 0, first.cols(), first.rows())
+        xoff, yoff, xsize, ysize = window
+        data_type = first.band().DataType
+        raw = first.dataset().ReadRaster(
+            xoff, yoff, xsize, ysize, buf_type=data_type,
+            band_list=[source.index() for source in sources])
+        dtype = gdal_array.GDALTypeCodeToNumericTypeCode(data_type)
+        return np.frombuffer(raw, dtype=dtype).reshape(
+            len(sources), ysize, xsize)
+
+    def _read(self, window):
+        if window is None:
+            return self.band().ReadAsArray()
+        xoff, yoff, xsize, ysize = window
+        return self.band().ReadAsArray(xoff, yoff, xsize, ysize)
+
+    def hasMask(self):
+        """
+        Returns whether the band has a GDAL mask band other than its nodata
+        value.
+        """
+        return self._masked
+
+    def readMask(self, window=None):
+        """
+        Reads the mask band of a window of the band.
+
+        :param window: (xoff, yoff, xsize, ysize) in pixels of the dataset.
+        If unspecified, the whole band is read.
+        :return: A bool array, False at the masked pixels.
+        """
+        if self._shared:
+            with RasterSource._lock:
+                return self._readMask(window)
+        return self._readMask(window)
+
+    def _readMask(self, window):
+        mask = self.band().GetMaskBand()
+        if window is None:
+            return mask.ReadAsArray() != 0
+        xoff, yoff, xsize, ysize = window
+        return mask.ReadAsArray(xoff, yoff, xsize, ysize) != 0
+
+    @staticmethod
+    def viewBands(sources, window=None, path=''):
+        """
+        Returns a VRT dataset over a window of several bands of the same
+        dataset (see datasetKey()), in the order of sources. No pixel is
+        read until it is used.
+
+        :param path: The path the VRT is written to, e.g. in /vsimem so
+        that other VRTs can refer to it. By default it is not written.
+        """
+        options = {'format': 'VRT',
+                   'bandList': [source.index() for source in sources]}
+        if window is not None:
+            options['srcWin'] = list(window)
+        return gdal.Translate(path, sources[0].dataset(), **options)
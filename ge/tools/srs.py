@@ -0,0 +1,103 @@
+import re
+import threading
+
+from osgeo import osr
+
+import ge.cache
+
+_EPSG = re.compile(r'EPSG:(\d+)', re.IGNORECASE)
+
+# The (spatial reference, WKT) of each CRS, shared by every thread.
+REFERENCES = ge.cache.LRUCache(maxsize=256)
+# The CoordinateTransformation objects, which GDAL does not allow to share
+# between threads, are cached per thread.
+MAX_TRANSFORMATIONS = 256
+_local = threading.local()
+
+
+class SRS():
+    """
+    Interned OSR spatial references and coordinate transformations.
+
+    Building an osr.SpatialReference, and even more so a
+    CoordinateTransformation, is costly compared to transforming one
+    geometry, so they are built once per CRS (or pair of CRSs) and reused.
+    The spatial references returned are shared: they must not be modified,
+    Clone() them first. All of them use the traditional GIS axis order,
+    (x, y) or (longitude, latitude), as GeoJSON and geotransforms do.
+    """
+
+    @staticmethod
+    def Key(crs):
+        """
+        Returns the normalized form of a CRS, 'EPSG:<code>' for plain EPSG
+        codes and the stripped string otherwise, e.g. for WKT or compound
+        codes such as 'EPSG:4326+5773'.
+        """
+        crs = crs.strip()
+        match = _EPSG.fullmatch(crs)
+        if match:
+            return 'EPSG:{0}'.format(int(match.group(1)))
+        return crs
+
+    @staticmethod
+    def _Entry(crs):
+        key = SRS.Key(crs)
+        entry = REFERENCES.get(key)
+        if entry is None:
+            reference = osr.SpatialReference()
+            match = _EPSG.fullmatch(key)
+            if match:
+                reference.ImportFromEPSG(int(match.group(1)))
+            else:
+                # WKT, or other codes such as compound ones.
+                reference.SetFromUserInput(key)
+            if hasattr(osr, 'OAMS_TRADITIONAL_GIS_ORDER'):
+                reference.SetAxisMappingStrategy(
+                    osr.OAMS_TRADITIONAL_GIS_ORDER)
+            entry = reference, reference.ExportToWkt()
+            REFERENCES.put(key, entry)
+        return entry
+
+    @staticmethod
+    def Get(crs):
+        """
+        Returns the shared spatial reference of a CRS.
+
+        :param crs: A well-known authority code (e.g. 'EPSG:4326') or a WKT
+        string.
+        """
+        return SRS._Entry(crs)[0]
+
+    @staticmethod
+    def Wkt(crs):
+        """
+        Returns the WKT of a CRS given as an authority code or a WKT string.
+        """
+        return SRS._Entry(crs)[1]
+
+    @staticmethod
+    def Transformation(source, target):
+        """
+        Returns the CoordinateTransformation between two CRSs, or None if
+        they are the same. The transformation is only cached for the
+        calling thread.
+
+        :param source: The source CRS, as an authority code or a WKT string.
+        :param target: The target CRS, as an authority code or a WKT string.
+        """
+        transformations = getattr(_local, 'transformations', None)
+        if transformations is None:
+            transformations = ge.cache.LRUCache(maxsize=MAX_TRANSFORMATIONS)
+            _local.transformations = transformations
+
+        key = SRS.Key(source), SRS.Key(target)
+        entry = transformations.get(key)
+        if entry is None:
+            sourceSR, targetSR = SRS.Get(source), SRS.Get(target)
+            if sourceSR.IsSame(targetSR):
+                entry = (None,)
+            else:
+                entry = (osr.CoordinateTransformation(sourceSR, targetSR),)
+            transformations.put(key, entry)
+        return entry[0]
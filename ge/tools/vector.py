@@ -1,4 +1,16 @@
-from osgeo import osr, ogr
+import struct
+
+import numpy
+from osgeo import ogr
+
+from .srs import SRS
+
+# The ISO WKB geometry types holding a list of points (LineString,
+# CircularString), a list of rings of points (Polygon, Triangle) or a list of
+# geometries.
+_WKB_POINT_LISTS = (2, 8)
+_WKB_RING_LISTS = (3, 17)
+_WKB_COLLECTIONS = (4, 5, 6, 7, 9, 10, 11, 12, 15, 16)
 
 
 class Vector():
@@ -6,9 +18,8 @@ class Vector():
     @staticmethod
     def Shape(geoJson):
         shape = ogr.GetDriverByName('MEMORY').CreateDataSource('')
-        srs = osr.SpatialReference()
-        srs.ImportFromEPSG(4326)
-        layer = shape.CreateLayer("default", srs, ogr.wkbPolygon)
+        layer = shape.CreateLayer("default", SRS.Get('EPSG:4326'),
+                                  ogr.wkbPolygon)
         feature = ogr.Feature(layer.GetLayerDefn())
         geometry = ogr.CreateGeometryFromJson(geoJson)
         feature.SetGeometry(geometry)
@@ -17,16 +28,145 @@ class Vector():
 
     @staticmethod
     def ReprojetLayer(layer, crs):
-        sourceSR = layer.GetSpatialRef()
-        targetSR = osr.SpatialReference()
-        targetSR.ImportFromWkt(crs)
-
-        coordTrans = osr.CoordinateTransformation(sourceSR, targetSR)
+        coordTrans = SRS.Transformation(layer.GetSpatialRef().ExportToWkt(),
+                                        crs)
         feat = layer.GetNextFeature()
-        geom = feat.GetGeometryRef()
-        geom.Transform(coordTrans)
+        if coordTrans is not None:
+            feat.GetGeometryRef().Transform(coordTrans)
         return feat
 
+    @staticmethod
+    def TransformGeometry(geometry, crs):
+        """
+        Returns a copy of an OGR geometry in another CRS. Geometries
+        without a spatial reference are taken as EPSG:4326, as in Shape().
+
+        :param crs: The WKT of the target CRS. If empty, the geometry is
+        only copied.
+        """
+        geometry = geometry.Clone()
+        if not crs:
+            return geometry
+        sourceSR = geometry.GetSpatialReference()
+        coordTrans = SRS.Transformation(
+            sourceSR.ExportToWkt() if sourceSR is not None else 'EPSG:4326',
+            crs)
+        if coordTrans is not None:
+            geometry.Transform(coordTrans)
+        return geometry
+
+    @staticmethod
+    def TransformGeometries(geometries, crs):
+        """
+        Returns copies of OGR geometries in another CRS, as
+        TransformGeometry() would, but with one transformation call per
+        source CRS instead of one per geometry: the coordinates of all the
+        geometries are read from their WKB into one array, transformed
+        together and written back at the same offsets.
+
+        :param geometries: The OGR geometries, None for missing ones.
+        :param crs: The WKT of the target CRS. If empty, the geometries are
+        only copied.
+        """
+        copies = [geometry.Clone() if geometry is not None else None
+                  for geometry in geometries]
+        if not crs:
+            return copies
+
+        targetSR = SRS.Get(crs)
+        groups = {}
+        for index, geometry in enumerate(copies):
+            if geometry is None:
+                continue
+            if geometry.IsEmpty():
+                geometry.AssignSpatialReference(targetSR)
+                continue
+            sourceSR = geometry.GetSpatialReference()
+            source = (sourceSR.ExportToWkt() if sourceSR is not None
+                      else 'EPSG:4326')
+            groups.setdefault(source, []).append(index)
+
+        for source, indices in groups.items():
+            coordTrans = SRS.Transformation(source, crs)
+            if coordTrans is None:
+                continue
+            wkbs = [bytearray(copies[index].ExportToIsoWkb(ogr.wkbNDR))
+                    for index in indices]
+            spans = []
+            for wkb in wkbs:
+                spans.append([])
+                Vector._WkbCoordinates(wkb, 0, spans[-1])
+
+            points = [Vector._WkbArray(wkb, span)
+                      for wkb, geometry_spans in zip(wkbs, spans)
+                      for span in geometry_spans]
+            if not points:
+                continue
+            coordinates = numpy.zeros((sum(len(array) for array in points),
+                                       3))
+            start = 0
+            for array in points:
+                coordinates[start:start + len(array), :array.shape[1]] = \
+                    array
+                start += len(array)
+
+            coordinates = numpy.asarray(
+                coordTrans.TransformPoints(coordinates), numpy.float64)
+            start = 0
+            for array in points:
+                array[:] = coordinates[start:start + len(array),
+                                       :array.shape[1]]
+                start += len(array)
+
+            for index, wkb in zip(indices, wkbs):
+                copies[index] = ogr.CreateGeometryFromWkb(bytes(wkb),
+                                                          targetSR)
+        return copies
+
+    @staticmethod
+    def _WkbCoordinates(wkb, offset, spans):
+        """
+        Appends the (offset, points, dimensions, z) of the coordinate arrays
+        of a little-endian ISO WKB geometry starting at offset to spans, and
+        returns the offset of its end.
+        """
+        code, = struct.unpack_from('<I', wkb, offset + 1)
+        offset += 5
+        kind, flags = code % 1000, code // 1000
+        z = flags in (1, 3)
+        dimensions = 2 + z + (flags in (2, 3))
+        if kind == 1:
+            spans.append((offset, 1, dimensions, z))
+            return offset + 8 * dimensions
+
+        count, = struct.unpack_from('<I', wkb, offset)
+        offset += 4
+        if kind in _WKB_POINT_LISTS:
+            spans.append((offset, count, dimensions, z))
+            return offset + 8 * dimensions * count
+        if kind in _WKB_RING_LISTS:
+            for _ in range(count):
+                points, = struct.unpack_from('<I', wkb, offset)
+                offset += 4
+                spans.append((offset, points, dimensions, z))
+                offset += 8 * dimensions * points
+            return offset
+        if kind in _WKB_COLLECTIONS:
+            for _ in range(count):
+                offset = Vector._WkbCoordinates(wkb, offset, spans)
+            return offset
+        raise ValueError('Unsupported WKB geometry type {0}.'.format(code))
+
+    @staticmethod
+    def _WkbArray(wkb, span):
+        """
+        Returns a writable (points, 2 or 3) view of the x, y and, if any,
+        z coordinates of a span of a WKB bytearray.
+        """
+        offset, points, dimensions, z = span
+        array = numpy.frombuffer(wkb, '<f8', points * dimensions, offset)
+        return array.reshape(points, dimensions)[:, :3 if z else 2]
+
     @staticmethod
     def Buffer(geoJson, distance, maxError, proj):
         geometry = ogr.CreateGeometryFromJson(geoJson)
@@ -0,0 +1,46 @@
+import os
+import sys
+import types
+import unittest
+from unittest import mock
+
+import ge.backend
+
+
+def tensorflow(devices):
+    module = types.ModuleType('tensorflow')
+    experimental = types.SimpleNamespace(
+        list_physical_devices=lambda kind: devices)
+    module.config = types.SimpleNamespace(experimental=experimental)
+    return module
+
+
+class DefaultBackendTest(unittest.TestCase):
+
+    def setUp(self):
+        self._backend = ge.backend._backend
+        ge.backend._backend = None
+
+    def tearDown(self):
+        ge.backend._backend = self._backend
+
+    def testTensorflowIsNotImported(self):
+        with mock.patch.dict(sys.modules):
+            sys.modules.pop('tensorflow', None)
+            self.assertEqual(ge.backend._default(), 'numpy')
+            self.assertNotIn('tensorflow', sys.modules)
+
+    def testImportedTensorflowWithAGpu(self):
+        with mock.patch.dict(sys.modules, tensorflow=tensorflow(['GPU:0'])):
+            self.assertEqual(ge.backend._default(), 'tensorflow')
+        with mock.patch.dict(sys.modules, tensorflow=tensorflow([])):
+            self.assertEqual(ge.backend._default(), 'numpy')
+
+    def testEnvironmentVariableComesFirst(self):
+        with mock.patch.dict(sys.modules, tensorflow=tensorflow(['GPU:0'])):
+            with mock.patch.dict(os.environ, GE_BACKEND='numpy'):
+                self.assertEqual(ge.backend.current().name, 'numpy')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+
+import numpy as np
+
+import ge
+import ge.dtypes
+from ge.image import Image
+
+
+def image(values, dtype):
+    return Image.fromArray(np.array([[values]], dtype=dtype))
+
+
+def result(image):
+    band = image.getInfo().getBands()[0]
+    return band.getDataType(), np.asarray(band.getData())
+
+
+class PromoteTest(unittest.TestCase):
+
+    def testAddOfBandsWidens(self):
+        _, dtype = ge.dtypes.promote('add', [np.uint16, np.uint16])
+        self.assertEqual(dtype, np.dtype(np.uint32))
+
+    def testConstantThatFitsKeepsType(self):
+        _, dtype = ge.dtypes.promote('multiply', [np.uint16, np.uint8],
+                                     [None, 1])
+        self.assertEqual(dtype, np.dtype(np.uint16))
+        _, dtype = ge.dtypes.promote('add', [np.int16, np.uint8], [None, 0])
+        self.assertEqual(dtype, np.dtype(np.int16))
+
+    def testConstantThatMayOverflowWidens(self):
+        _, dtype = ge.dtypes.promote('add', [np.uint8, np.uint8],
+                                     [None, 10])
+        self.assertEqual(dtype, np.dtype(np.uint16))
+        _, dtype = ge.dtypes.promote('multiply', [np.uint8, np.uint8],
+                                     [None, 2])
+        self.assertEqual(dtype, np.dtype(np.uint16))
+
+    def testWideningStopsAt32Bits(self):
+        _, dtype = ge.dtypes.promote('add', [np.uint32, np.uint16])
+        self.assertEqual(dtype, np.dtype(np.uint32))
+        _, dtype = ge.dtypes.promote('subtract', [np.uint16, np.uint16])
+        self.assertEqual(dtype, np.dtype(np.int32))
+
+    def testFloatsAreNotWidened(self):
+        _, dtype = ge.dtypes.promote('add', [np.float32, np.int32])
+        self.assertEqual(dtype, np.dtype(np.float32))
+
+    def testNewerGdalTypes(self):
+        for name, dtype in (('GDT_Int8', np.int8), ('GDT_Int64', np.int64),
+                            ('GDT_UInt64', np.uint64)):
+            code = getattr(ge.dtypes.gdal, name, None)
+            if code is not None:
+                self.assertEqual(ge.dtypes.toNumpy(code), np.dtype(dtype))
+
+
+class ConstantArithmeticTest(unittest.TestCase):
+
+    def testUint8AddDoesNotWrap(self):
+        dtype, data = result(image([250], np.uint8).add(10))
+        self.assertEqual(dtype, np.dtype(np.uint16))
+        self.assertEqual(data.tolist(), [[260]])
+
+    def testUint8MultiplyDoesNotWrap(self):
+        dtype, data = result(image([250], np.uint8).multiply(2))
+        self.assertEqual(dtype, np.dtype(np.uint16))
+        self.assertEqual(data.tolist(), [[500]])
+
+    def testChainsStayAt32Bits(self):
+        dtype, data = result(image([1], np.uint8).add(1).add(1).add(1))
+        self.assertLessEqual(dtype.itemsize, 4)
+        self.assertEqual(data.tolist(), [[4]])
+
+
+if __name__ == '__main__':
+    unittest.main()
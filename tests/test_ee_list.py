@@ -0,0 +1,65 @@
+import unittest
+
+import ge
+
+
+class ListViewTest(unittest.TestCase):
+
+    def testAddDoesNotChangeTheList(self):
+        first = ge.List([1])
+        second = first.add(2)
+        self.assertEqual(list(first), [1])
+        self.assertEqual(list(second), [1, 2])
+        self.assertEqual(first, ge.List([1]))
+        self.assertEqual(hash(first), hash(ge.List([1])))
+        self.assertNotEqual(first, second)
+
+    def testAddsFromTheSameListDoNotSeeEachOther(self):
+        base = ge.List([1, 2])
+        left = base.add(3)
+        right = base.add(4)
+        self.assertEqual(list(left), [1, 2, 3])
+        self.assertEqual(list(right), [1, 2, 4])
+        self.assertEqual(list(base), [1, 2])
+
+    def testChainOfAdds(self):
+        numbers = ge.List([])
+        for number in range(100):
+            numbers = numbers.add(number)
+        self.assertEqual(list(numbers), list(range(100)))
+        self.assertEqual(numbers.length(), 100)
+
+    def testCat(self):
+        base = ge.List([1])
+        joined = base.cat([2, 3])
+        other = base.cat(ge.List([4]))
+        self.assertEqual(list(joined), [1, 2, 3])
+        self.assertEqual(list(other), [1, 4])
+        self.assertEqual(list(base), [1])
+        self.assertEqual(joined, ge.List([1, 2, 3]))
+
+    def testSlice(self):
+        numbers = ge.List([0, 1, 2, 3, 4])
+        self.assertEqual(list(numbers.slice(1, 3)), [1, 2])
+        self.assertEqual(list(numbers[1:-1]), [1, 2, 3])
+        self.assertEqual(list(numbers[::2]), [0, 2, 4])
+        self.assertEqual(numbers.slice(1, 3), ge.List([1, 2]))
+        self.assertEqual(list(numbers.slice(3, 1)), [])
+
+    def testAddToASlice(self):
+        numbers = ge.List([0, 1, 2, 3])
+        middle = numbers.slice(1, 3).add(9)
+        self.assertEqual(list(middle), [1, 2, 9])
+        self.assertEqual(list(numbers), [0, 1, 2, 3])
+        self.assertEqual(list(numbers.add(4)), [0, 1, 2, 3, 4])
+
+    def testGet(self):
+        numbers = ge.List([0, 1, 2]).slice(1, 3)
+        self.assertEqual(numbers.get(0), 1)
+        self.assertEqual(numbers.get(-1), 2)
+        with self.assertRaises(IndexError):
+            numbers.get(2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,76 @@
+import unittest
+
+import numpy as np
+
+import ge
+from ge.image import Image
+
+NIR = [[10, 20], [30, 40]]
+RED = [[4, 8], [30, 1]]
+
+
+def image():
+    return Image.fromArray(np.array([NIR, RED], dtype=np.uint16),
+                           bandNames=['NIR', 'RED'])
+
+
+def bands(image):
+    return [(band.getName(), band.getDataType(), np.asarray(band.getData()))
+            for band in image.getInfo().getBands()]
+
+
+class ExpressionTest(unittest.TestCase):
+
+    def evaluate(self, expression, map=None):
+        [band] = bands(image().expression(expression, map))
+        return band
+
+    def testArithmetic(self):
+        name, _, data = self.evaluate('(NIR - RED) / (NIR + RED)')
+        nir, red = np.array(NIR, float), np.array(RED, float)
+        self.assertEqual(name, 'NIR')
+        np.testing.assert_allclose(data, (nir - red) / (nir + red),
+                                   rtol=1e-6)
+
+    def testBandFunctionAndVariables(self):
+        _, _, data = self.evaluate("b('NIR') * scale + b(1)",
+                                   {'scale': 2})
+        np.testing.assert_array_equal(
+            data, np.array(NIR) * 2 + np.array(RED))
+
+    def testFunctionsAndComparisons(self):
+        _, _, data = self.evaluate('max(NIR, RED) + sqrt(4)')
+        np.testing.assert_allclose(data, np.maximum(NIR, RED) + 2)
+        _, _, data = self.evaluate('RED < NIR < 35')
+        np.testing.assert_array_equal(data != 0, [[True, True],
+                                                  [False, False]])
+
+    def testUnaryMinus(self):
+        _, dtype, data = self.evaluate('-NIR')
+        self.assertEqual(dtype, np.dtype(np.int32))
+        np.testing.assert_array_equal(data, -np.array(NIR))
+        _, _, data = self.evaluate('NIR * -1.5')
+        np.testing.assert_allclose(data, np.array(NIR) * -1.5)
+
+    def testConditional(self):
+        name, _, data = self.evaluate('NIR if NIR > RED else RED')
+        self.assertEqual(name, 'NIR')
+        np.testing.assert_array_equal(data, np.maximum(NIR, RED))
+
+    def testConditionalIsNamedAfterABand(self):
+        name, _, data = self.evaluate('0 if NIR > 25 else RED')
+        self.assertEqual(name, 'RED')
+        np.testing.assert_array_equal(data, [[4, 8], [0, 0]])
+        name, _, _ = self.evaluate('NIR if NIR > 25 else 0')
+        self.assertEqual(name, 'NIR')
+
+    def testInvalidExpressions(self):
+        for expression in ('NIR +', 'NIR.foo', "'a' + NIR", 'foo(NIR)',
+                           'True + NIR', 'b(NIR)'):
+            with self.subTest(expression=expression):
+                with self.assertRaises(ge.EEException):
+                    image().expression(expression)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,63 @@
+import unittest
+
+import numpy as np
+
+from ge.image import Image
+
+VALUES = [[1, 2], [3, 4]]
+
+
+def image(values=VALUES, name='B1', dtype=np.uint8):
+    return Image.fromArray(np.array([values], dtype=dtype), bandNames=[name])
+
+
+def band(image):
+    [band] = image.getInfo().getBands()
+    mask = band.getMask()
+    if mask is not None:
+        mask = np.broadcast_to(np.asarray(mask), np.shape(VALUES))
+    return band.getName(), np.asarray(band.getData()), mask
+
+
+class WhereTest(unittest.TestCase):
+
+    def testReplacesWhereTestIsNonzero(self):
+        test = image([[0, 1], [1, 0]], 'test')
+        value = image(VALUES, 'value').multiply(0)
+        name, data, _ = band(image().where(test, value))
+        self.assertEqual(name, 'B1')
+        np.testing.assert_array_equal(data, [[1, 0], [0, 4]])
+
+    def testNamedAfterTheInput(self):
+        test = image([[0, 1], [1, 0]], 'test')
+        name, data, _ = band(image().where(test, 9))
+        self.assertEqual(name, 'B1')
+        np.testing.assert_array_equal(data, [[1, 9], [9, 4]])
+
+    def testConstantInputIsNamedAfterTheValue(self):
+        test = image([[0, 1], [1, 0]], 'test')
+        name, data, _ = band(Image(0).where(test, image(VALUES, 'value')))
+        self.assertEqual(name, 'value')
+        np.testing.assert_array_equal(data, [[0, 2], [3, 0]])
+
+
+class MaskTest(unittest.TestCase):
+
+    def testUpdateMaskKeepsValues(self):
+        masked = image().updateMask(image([[1, 0], [1, 1]], 'mask'))
+        name, data, mask = band(masked)
+        self.assertEqual(name, 'B1')
+        np.testing.assert_array_equal(data, VALUES)
+        np.testing.assert_array_equal(mask, [[True, False], [True, True]])
+
+    def testMaskAndUnmask(self):
+        masked = image().updateMask(image([[1, 0], [0, 1]], 'mask'))
+        _, data, _ = band(masked.mask())
+        np.testing.assert_array_equal(data, [[1, 0], [0, 1]])
+        _, data, mask = band(masked.unmask(7))
+        np.testing.assert_array_equal(data, [[1, 7], [7, 4]])
+        self.assertTrue(mask is None or mask.all())
+
+
+if __name__ == '__main__':
+    unittest.main()
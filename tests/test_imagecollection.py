@@ -0,0 +1,65 @@
+import unittest
+
+import numpy as np
+
+import ge
+from ge.image import Image
+from ge.imagecollection import ImageCollection
+
+VALUES = [[[1, 5]], [[3, 2]], [[8, 4]], [[6, 7]]]
+
+
+def collection(values=VALUES, masks=None):
+    images = []
+    for index, value in enumerate(values):
+        image = Image.fromArray(np.array([value], dtype=np.float32))
+        if masks is not None:
+            image = image.updateMask(
+                Image.fromArray(np.array([masks[index]], dtype=np.uint8)))
+        images.append(image)
+    return ImageCollection(images)
+
+
+def bands(image):
+    return [(band.getName(), np.asarray(band.getData()),
+             band.getMask()) for band in image.getInfo().getBands()]
+
+
+class ReduceTest(unittest.TestCase):
+
+    def assertReduces(self, reducer, expected):
+        self.assertTrue(reducer.streaming())
+        [(_, data, _)] = bands(collection().reduce(reducer))
+        np.testing.assert_allclose(data, expected, rtol=1e-6)
+
+    def testStreamingReducers(self):
+        stack = np.array(VALUES, dtype=np.float64)
+        self.assertReduces(ge.Reducer.sum(), stack.sum(axis=0))
+        self.assertReduces(ge.Reducer.min(), stack.min(axis=0))
+        self.assertReduces(ge.Reducer.max(), stack.max(axis=0))
+        self.assertReduces(ge.Reducer.mean(), stack.mean(axis=0))
+        self.assertReduces(ge.Reducer.count(), [[4, 4]])
+        self.assertReduces(ge.Reducer.variance(), stack.var(axis=0))
+
+    def testStackedReducer(self):
+        reducer = ge.Reducer.median()
+        self.assertFalse(reducer.streaming())
+        [(name, data, _)] = bands(collection().reduce(reducer))
+        self.assertEqual(name.split('_')[-1], 'median')
+        np.testing.assert_allclose(
+            data, np.median(np.array(VALUES, dtype=np.float64), axis=0))
+
+    def testMaskedPixelsAreLeftOut(self):
+        masks = [[[1, 0]], [[1, 0]], [[0, 0]], [[1, 0]]]
+        [(_, data, mask)] = bands(
+            collection(masks=masks).reduce(ge.Reducer.mean()))
+        self.assertAlmostEqual(float(data[0, 0]), (1 + 3 + 6) / 3.0, places=5)
+        self.assertFalse(np.asarray(mask)[0, 1])
+
+    def testEmptyCollection(self):
+        with self.assertRaises(ge.EEException):
+            ImageCollection([]).reduce(ge.Reducer.mean())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,73 @@
+import os
+import shutil
+import tempfile
+import tracemalloc
+import unittest
+
+import numpy as np
+
+try:
+    from osgeo import gdal
+except ImportError:
+    gdal = None
+
+HAS_GDAL = gdal is not None and hasattr(gdal, 'GetDriverByName')
+
+if HAS_GDAL:
+    import ge
+    from ge.imagecollection import ImageCollection
+
+
+@unittest.skipIf(not HAS_GDAL, 'GDAL is not installed')
+class StreamingReadTest(unittest.TestCase):
+
+    SIZE = 500
+
+    def setUp(self):
+        self._directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self._directory)
+
+    def images(self, count):
+        paths = []
+        driver = gdal.GetDriverByName('GTiff')
+        for index in range(count):
+            path = os.path.join(self._directory, '{0}.tif'.format(index))
+            if not os.path.exists(path):
+                dataset = driver.Create(path, self.SIZE, self.SIZE, 2,
+                                        gdal.GDT_UInt16)
+                dataset.SetGeoTransform((0, 1, 0, 0, 0, -1))
+                for band in (1, 2):
+                    dataset.GetRasterBand(band).WriteArray(
+                        np.full((self.SIZE, self.SIZE), index + band,
+                                dtype=np.uint16))
+                dataset = None
+            paths.append(path)
+        return [ge.Image(path) for path in paths]
+
+    def peak(self, count):
+        collection = ImageCollection(self.images(count))
+        tracemalloc.start()
+        try:
+            result = collection.reduce(ge.Reducer.mean()).getInfo()
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+        bands = result.getBands()
+        self.assertAlmostEqual(float(bands[0].getData()[0, 0]),
+                               (count + 1) / 2.0)
+        self.assertAlmostEqual(float(bands[1].getData()[0, 0]),
+                               (count + 1) / 2.0 + 1)
+        return peak
+
+    def testPeakMemoryDoesNotGrowWithTheCollection(self):
+        # One image plus the accumulators, whatever the number of images:
+        # the bands of an image are not read ahead of their reduction.
+        small = self.peak(10)
+        large = self.peak(40)
+        self.assertLess(large, small * 1.5)
+
+
+if __name__ == '__main__':
+    unittest.main()
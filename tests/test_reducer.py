@@ -0,0 +1,75 @@
+import unittest
+
+import numpy as np
+
+import ge
+
+PERCENTILES = [0, 10, 25, 50, 90, 100]
+
+
+def sketch(reducer, stack, masks=None):
+    masks = masks if masks is not None else [None] * len(stack)
+    state = reducer.initialize(np, stack[0], masks[0])
+    for array, mask in zip(stack[1:], masks[1:]):
+        state = reducer.accumulate(np, state, array, mask)
+    return reducer.finalize(np, state)
+
+
+class SketchPercentileTest(unittest.TestCase):
+
+    def setUp(self):
+        # 101 values per pixel, so that the percentiles fall on ranks and
+        # np.percentile returns one of the values.
+        random = np.random.RandomState(0)
+        self.stack = random.uniform(0, 100, (101, 8, 9)).astype(np.float32)
+        self.reducer = ge.Reducer.percentile(PERCENTILES, maxBuckets=50,
+                                             minValue=0, maxValue=100)
+        self.width = 100 / 50.0
+
+    def testMatchesPercentilesWithinHalfABucket(self):
+        values, valid = sketch(self.reducer, self.stack)
+        self.assertIsNone(valid)
+        expected = np.percentile(self.stack, PERCENTILES, axis=0)
+        for percentile, value, exact in zip(PERCENTILES, values, expected):
+            with self.subTest(percentile=percentile):
+                self.assertEqual(value.shape, exact.shape)
+                self.assertLessEqual(np.max(np.abs(value - exact)),
+                                     self.width / 2 + 1e-4)
+
+    def testMaskedValuesAreLeftOut(self):
+        masks = np.ones(self.stack.shape, dtype=bool)
+        masks[41:] = False
+        masks[:, 0, 0] = False
+        values, valid = sketch(self.reducer, self.stack, list(masks))
+        expected = np.percentile(self.stack[:41], PERCENTILES, axis=0)
+        for percentile, value, exact in zip(PERCENTILES, values, expected):
+            with self.subTest(percentile=percentile):
+                self.assertTrue(np.isnan(value[0, 0]))
+                difference = np.abs(value - exact)[valid]
+                self.assertLessEqual(np.max(difference),
+                                     self.width / 2 + 1e-4)
+        self.assertFalse(valid[0, 0])
+        self.assertEqual(int(np.sum(valid)), valid.size - 1)
+
+    def testValuesOutOfRangeCountInTheEdgeBuckets(self):
+        stack = np.array([[[-10]], [[5]], [[500]]], dtype=np.float32)
+        values, _ = sketch(self.reducer, stack)
+        self.assertAlmostEqual(float(values[0][0, 0]), self.width / 2)
+        self.assertAlmostEqual(float(values[-1][0, 0]), 100 - self.width / 2)
+
+    def testMatchesTheComparisonOfEveryBucket(self):
+        # The numpy counts are indexed directly, other backends compare
+        # each value with every bucket.
+        state = np.zeros((50, 8, 9), dtype=np.uint16)
+        expected = state.copy()
+        for array in self.stack[:10]:
+            mask = array > 10
+            state = self.reducer._count(state, array, mask)
+            expected = expected + (
+                self.reducer._bucket(np, array, mask) ==
+                self.reducer._buckets(np, array))
+        np.testing.assert_array_equal(state, expected)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,74 @@
+import gc
+import unittest
+
+import numpy as np
+
+try:
+    from osgeo import gdal
+except ImportError:
+    gdal = None
+
+HAS_GDAL = gdal is not None and hasattr(gdal, 'GetDriverByName')
+
+if HAS_GDAL:
+    import ge
+    from ge.executor import Executor
+    from ge.tools import SRS, MemoryFiles, RasterSource
+
+PATH = '/vsimem/ge/test/source.tif'
+
+
+def create(path):
+    dataset = gdal.GetDriverByName('GTiff').Create(path, 4, 3, 1,
+                                                   gdal.GDT_Byte)
+    dataset.SetGeoTransform((0, 1, 0, 0, 0, -1))
+    dataset.SetProjection(SRS.Wkt('EPSG:4326'))
+    dataset.GetRasterBand(1).WriteArray(np.arange(12).reshape(3, 4))
+    dataset.FlushCache()
+    return dataset
+
+
+@unittest.skipIf(not HAS_GDAL, 'GDAL is not installed')
+class MemoryFilesTest(unittest.TestCase):
+
+    def testUnlinkedWhenTheLastSourceIsReleased(self):
+        dataset = create(PATH)
+        files = MemoryFiles(PATH)
+        sources = [RasterSource(dataset, 1, files) for _ in range(2)]
+        del dataset, files
+        sources.pop()
+        gc.collect()
+        self.assertIsNotNone(gdal.VSIStatL(PATH))
+        self.assertEqual(sources[0].read().tolist(),
+                         np.arange(12).reshape(3, 4).tolist())
+        sources.pop()
+        gc.collect()
+        self.assertIsNone(gdal.VSIStatL(PATH))
+
+    def testWarpedVrtsAreUnlinked(self):
+        create(PATH)
+        image = ge.Image(PATH).reproject('EPSG:3857')
+        paths = image.getBands()[0].getSource()._files.paths()
+        self.assertTrue(all(gdal.VSIStatL(path) for path in paths))
+        del image
+        gc.collect()
+        self.assertFalse(any(gdal.VSIStatL(path) for path in paths))
+        gdal.Unlink(PATH)
+
+
+@unittest.skipIf(not HAS_GDAL, 'GDAL is not installed')
+class ProcessPoolTest(unittest.TestCase):
+
+    def tearDown(self):
+        gdal.Unlink(PATH)
+
+    def testInMemorySourcesAreRejected(self):
+        create(PATH)
+        image = ge.Image(PATH)
+        with self.assertRaises(ge.EEException):
+            Executor(image, workers=2, pool='process')
+        Executor(image, workers=2, pool='thread')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,118 @@
+import unittest
+
+try:
+    from osgeo import ogr
+except ImportError:
+    ogr = None
+
+HAS_GDAL = ogr is not None and hasattr(ogr, 'CreateGeometryFromWkt')
+
+if HAS_GDAL:
+    from ge.tools import SRS, Vector
+
+SOURCE = 'EPSG:4326'
+TARGET = 'EPSG:3857'
+
+POLYGON_WITH_HOLE = ('((-50 -10, -40 -10, -40 0, -50 0, -50 -10), '
+                     '(-48 -8, -42 -8, -42 -2, -48 -2, -48 -8))')
+
+GEOMETRIES = [
+    'POINT (-45.5 -3.25)',
+    'LINESTRING (-45 -3, -44 -4, -43 -5)',
+    'POLYGON ' + POLYGON_WITH_HOLE,
+    'MULTIPOINT ((-45 -3), (-44 -4))',
+    'MULTILINESTRING ((-45 -3, -44 -4), (-43 -5, -42 -6, -41 -7))',
+    'MULTIPOLYGON ((' + POLYGON_WITH_HOLE[1:-1] + '), '
+    '((-30 -10, -20 -10, -20 0, -30 -10)))',
+    'GEOMETRYCOLLECTION (POINT Z (-45 -3 10), MULTIPOLYGON ((' +
+    POLYGON_WITH_HOLE[1:-1] + ')), LINESTRING (-45 -3, -44 -4))',
+    'POINT Z (-45 -3 100)',
+    'LINESTRING Z (-45 -3 1, -44 -4 2)',
+    'POLYGON Z ((-50 -10 1, -40 -10 2, -40 0 3, -50 -10 1))',
+    'POINT M (-45 -3 7)',
+    'LINESTRING M (-45 -3 7, -44 -4 8)',
+    'MULTIPOLYGON ZM (((-50 -10 1 5, -40 -10 2 6, -40 0 3 7, '
+    '-50 -10 1 5)))',
+]
+
+
+def coordinates(geometry):
+    """Returns the (x, y, z, m) of every point of a geometry, by part."""
+    if geometry.GetGeometryCount():
+        return [coordinates(geometry.GetGeometryRef(index))
+                for index in range(geometry.GetGeometryCount())]
+    return [(geometry.GetX(index), geometry.GetY(index),
+             geometry.GetZ(index), geometry.GetM(index))
+            for index in range(geometry.GetPointCount())]
+
+
+def flatten(parts):
+    if isinstance(parts, tuple):
+        return [parts]
+    return [point for part in parts for point in flatten(part)]
+
+
+@unittest.skipIf(not HAS_GDAL, 'GDAL is not installed')
+class TransformGeometriesTest(unittest.TestCase):
+
+    def geometry(self, wkt):
+        geometry = ogr.CreateGeometryFromWkt(wkt)
+        geometry.AssignSpatialReference(SRS.Get(SOURCE))
+        return geometry
+
+    def assertSameGeometry(self, actual, expected):
+        self.assertEqual(actual.GetGeometryType(),
+                         expected.GetGeometryType())
+        self.assertEqual(actual.GetGeometryCount(),
+                         expected.GetGeometryCount())
+        actual_points = flatten(coordinates(actual))
+        expected_points = flatten(coordinates(expected))
+        self.assertEqual(len(actual_points), len(expected_points))
+        for actual_point, expected_point in zip(actual_points,
+                                                expected_points):
+            for actual_value, expected_value in zip(actual_point,
+                                                    expected_point):
+                self.assertAlmostEqual(actual_value, expected_value, places=6)
+
+    def testMatchesPerGeometryTransform(self):
+        geometries = [self.geometry(wkt) for wkt in GEOMETRIES]
+        transformed = Vector.TransformGeometries(geometries, TARGET)
+
+        coordTrans = SRS.Transformation(SOURCE, TARGET)
+        for wkt, geometry, result in zip(GEOMETRIES, geometries,
+                                         transformed):
+            expected = geometry.Clone()
+            expected.Transform(coordTrans)
+            with self.subTest(wkt=wkt):
+                self.assertSameGeometry(result, expected)
+                self.assertTrue(
+                    result.GetSpatialReference().IsSame(SRS.Get(TARGET)))
+
+    def testInputsAreNotModified(self):
+        geometries = [self.geometry(wkt) for wkt in GEOMETRIES]
+        Vector.TransformGeometries(geometries, TARGET)
+        for wkt, geometry in zip(GEOMETRIES, geometries):
+            with self.subTest(wkt=wkt):
+                self.assertSameGeometry(geometry, self.geometry(wkt))
+
+    def testMissingAndEmptyGeometries(self):
+        empty = self.geometry('POLYGON EMPTY')
+        point = self.geometry(GEOMETRIES[0])
+        transformed = Vector.TransformGeometries([None, empty, point],
+                                                 TARGET)
+        self.assertIsNone(transformed[0])
+        self.assertTrue(transformed[1].IsEmpty())
+        expected = point.Clone()
+        expected.Transform(SRS.Transformation(SOURCE, TARGET))
+        self.assertSameGeometry(transformed[2], expected)
+
+    def testSameCrsOnlyCopies(self):
+        geometries = [self.geometry(wkt) for wkt in GEOMETRIES]
+        transformed = Vector.TransformGeometries(geometries, SOURCE)
+        for geometry, result in zip(geometries, transformed):
+            self.assertIsNot(result, geometry)
+            self.assertSameGeometry(result, geometry)
+
+
+if __name__ == '__main__':
+    unittest.main()